@@ -101,13 +101,15 @@ class BASQ(TensorManager):
         else:
             raise ValueError("Evidence has not yet computed.")
     
-    def sampling_posterior(self, n_samples, ratio_super=100):
+    def sampling_posterior(self, n_samples, ratio_super=100, scheme="multinomial", replacement=False):
         """
         Approximately sampling from posterior via sequential importance resampling (SIR)
         
         Args:
            - n_samples: int, number of samples to draw
            - ratio_super: float, the ratio to supersample
+           - scheme: string, the resampling scheme, select from ["multinomial", "systematic", "stratified", "residual"]
+           - replacement: bool, resample with replacement if true, otherwise not.
            
         Returns:
             - samples: torch.tensor, the samples from the estimated posterior
@@ -118,7 +120,9 @@ class BASQ(TensorManager):
         pdf_posterior = self.posterior(samples)
         weights = pdf_posterior / pdf_sampler
         weights = self.sampler.sober.cleansing_weights(weights)
-        idx = self.sampler.sober.weighted_resampling(weights.detach(), n_samples)
+        idx = self.sampler.sober.weighted_resampling(
+            weights.detach(), n_samples, scheme=scheme, replacement=replacement,
+        )
         samples = samples[idx]
         return samples
     
@@ -1,6 +1,6 @@
 import copy
 import torch
-from .._gp import update_gp, predict, predictive_covariance
+from .._gp import update_gp, update_warped_gp, predict, predictive_covariance
 from .._utils import Utils
 
 
@@ -143,25 +143,21 @@ class ScaleMmltGP(Utils):
         Yall_h = self.process_y_warping_with_scaling(Yall_log)
         return Xall, Yall_h
 
-    def update_mmlt_gp_with_scaling(self, X, Y):
+    def update_mmlt_gp_with_scaling(self, X, Y, incremental=False, refit=False, n_restarts=1, n_workers=None):
         """
         Args:
            - X: torch.tensor, X samples to be added to the existing data Xobs
            - Y: torch.tensor, unwarped Y observations to be added to the existing data Yobs
+           - incremental: bool, update the existing GP model instead of rebuilding it from the defaults, see update_gp_incremental
+           - refit: bool, flag whether or not to retrain the hyperparameters in the incremental update
+           - n_restarts: int, the number of restarts of hyperparameter training, see train_GP_multistart
+           - n_workers: int, the number of worker processes for the restarts
         """
+        beta_old = self.beta
         X_h, Y_h = self.cat_observations_with_scaling(X, Y)
-        self.model = update_gp(
-            X_h,
-            Y_h,
-            self.gp_kernel,
-            self.device,
-            lik=self.lik,
-            training_iter=self.training_iter,
-            thresh=self.thresh,
-            lr=self.lr,
-            rng=self.rng,
-            train_lik=self.train_lik,
-            optimiser=self.optimiser,
+        update_warped_gp(
+            self, X_h, Y_h, bool(self.beta == beta_old), incremental=incremental, refit=refit,
+            n_restarts=n_restarts, n_workers=n_workers,
         )
 
     def retrain_gp_with_scaling(self):
@@ -179,6 +175,7 @@ class ScaleMmltGP(Utils):
             rng=self.rng,
             train_lik=self.train_lik,
             optimiser=self.optimiser,
+            initial_state=self.model.state_dict(),
         )
     
     def memorise_parameters(self):
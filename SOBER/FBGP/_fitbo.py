@@ -1,6 +1,6 @@
 import copy
 import torch
-from .._gp import set_gp, update_gp, predict, predictive_covariance
+from .._gp import set_gp, update_gp, update_warped_gp, predict, predictive_covariance
 from .._utils import Utils
 
 
@@ -142,25 +142,21 @@ class FitboGP:
         Yall = self.process_y_warping(_Yall)
         return Xall, Yall
 
-    def update_wsabi_gp(self, X, Y):
+    def update_wsabi_gp(self, X, Y, incremental=False, refit=False, n_restarts=1, n_workers=None):
         """
         Args:
            - X: torch.tensor, X samples to be added to the existing data Xobs
            - Y: torch.tensor, unwarped Y observations to be added to the existing data Yobs
+           - incremental: bool, update the existing GP model instead of rebuilding it from the defaults, see update_gp_incremental
+           - refit: bool, flag whether or not to retrain the hyperparameters in the incremental update
+           - n_restarts: int, the number of restarts of hyperparameter training, see train_GP_multistart
+           - n_workers: int, the number of worker processes for the restarts
         """
+        alpha_old = self.alpha
         X_warp, Y_warp = self.cat_observations(X, Y)
-        self.model = update_gp(
-            X_warp,
-            Y_warp,
-            self.gp_kernel,
-            self.device,
-            lik=self.lik,
-            training_iter=self.training_iter,
-            thresh=self.thresh,
-            lr=self.lr,
-            rng=self.rng,
-            train_lik=self.train_lik,
-            optimiser=self.optimiser,
+        update_warped_gp(
+            self, X_warp, Y_warp, bool(self.alpha == alpha_old), incremental=incremental, refit=refit,
+            n_restarts=n_restarts, n_workers=n_workers,
         )
         """
         self.model = set_gp(
@@ -189,6 +185,7 @@ class FitboGP:
             rng=self.rng,
             train_lik=self.train_lik,
             optimiser=self.optimiser,
+            initial_state=self.model.state_dict(),
         )
 
     def memorise_parameters(self):
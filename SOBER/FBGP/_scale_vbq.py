@@ -1,6 +1,6 @@
 import copy
 import torch
-from .._gp import update_gp, predict, predictive_covariance
+from .._gp import update_gp, update_warped_gp, predict, predictive_covariance
 from .._utils import Utils
 
 
@@ -98,25 +98,21 @@ class ScaleVanillaGP:
         Yall_exp = self.process_y_with_scaling(Yall_log)
         return Xall, Yall_exp
 
-    def update_gp(self, X, Y):
+    def update_gp(self, X, Y, incremental=False, refit=False, n_restarts=1, n_workers=None):
         """
         Args:
            - X: torch.tensor, X samples to be added to the existing data Xobs
            - Y: torch.tensor, Y observations to be added to the existing data Yobs
+           - incremental: bool, update the existing GP model instead of rebuilding it from the defaults, see update_gp_incremental
+           - refit: bool, flag whether or not to retrain the hyperparameters in the incremental update
+           - n_restarts: int, the number of restarts of hyperparameter training, see train_GP_multistart
+           - n_workers: int, the number of worker processes for the restarts
         """
+        beta_old = self.beta
         Xall, Yall = self.cat_observations_with_scaling(X, Y)
-        self.model = update_gp(
-            Xall,
-            Yall,
-            self.gp_kernel,
-            self.device,
-            lik=self.lik,
-            training_iter=self.training_iter,
-            thresh=self.thresh,
-            lr=self.lr,
-            rng=self.rng,
-            train_lik=self.train_lik,
-            optimiser=self.optimiser,
+        update_warped_gp(
+            self, Xall, Yall, bool(self.beta == beta_old), incremental=incremental, refit=refit,
+            n_restarts=n_restarts, n_workers=n_workers,
         )
 
     def retrain_gp(self):
@@ -134,6 +130,7 @@ class ScaleVanillaGP:
             rng=self.rng,
             train_lik=self.train_lik,
             optimiser=self.optimiser,
+            initial_state=self.model.state_dict(),
         )
 
     def predictive_kernel(self, x, y):
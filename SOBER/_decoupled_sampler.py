@@ -0,0 +1,138 @@
+import torch
+from ._gp import get_cov_root
+from ._rff import RandomFourierFeatures
+from ._utils import TensorManager
+
+
+class DecoupledSampler(TensorManager):
+    def __init__(self, model, n_samples=64, n_features=1024):
+        """
+        Pathwise posterior sampling of GP via decoupled sampling, ported from benchmarks/gp_sampling.
+        Each sample path is f_j(x) = m(x) + phi(x) @ w_j + K(x, Xobs) @ v_j, where the prior path phi(x) @ w_j
+        is approximated with random Fourier features, and the update term is computed exactly as
+        v_j = (K(Xobs, Xobs) + s2 I)^(-1) (y - m(Xobs) - phi(Xobs) @ w_j - e_j), e_j ~ N(0, s2 I).
+        The paths are drawn once, then evaluated at any inputs in O(n_data (n_features + n_obs)) per path.
+        See Wilson, J. et al., Efficiently sampling functions from Gaussian process posteriors (ICML 2020)
+
+        Args:
+        - model: gpytorch.models, function of GP model with ScaleKernel(RBFKernel or MaternKernel)
+        - n_samples: int, the number of sample paths
+        - n_features: int, the number of random Fourier features
+        """
+        super().__init__() # call TensorManager
+        self.model = model
+        self.n_samples = n_samples
+        Xobs = model.train_inputs[0]
+        self.rff = RandomFourierFeatures(model.covar_module, Xobs.shape[-1], n_features)
+        self.reset_samples()
+
+    def reset_samples(self):
+        """
+        Draw a new batch of sample paths
+        """
+        S, Xobs, lik_var = get_cov_root(self.model)
+        self.Xobs = Xobs
+        self.rff.reset_random_variables()
+        self.W = self.standardise_tensor(torch.randn(self.rff.n_features, self.n_samples))
+        with torch.no_grad():
+            prior_obs = self.rff(Xobs) @ self.W
+            noise = lik_var.sqrt() * self.standardise_tensor(torch.randn(prior_obs.shape))
+            residual = (self.model.train_targets - self.model.mean_module(Xobs)).unsqueeze(-1) - prior_obs - noise
+            self.V = S @ (S.T @ residual)
+
+    def __call__(self, x):
+        """
+        Evaluate the sample paths at x
+
+        Args:
+        - x: torch.tensor, inputs. torch.Size(n_data, n_dims)
+
+        Return:
+        - f: torch.tensor, the values of the sample paths. torch.Size(n_samples, n_data)
+        """
+        with torch.no_grad():
+            f = self.rff(x) @ self.W + self.model.covar_module.forward(x, self.Xobs) @ self.V
+            f = f + self.model.mean_module(x).unsqueeze(-1)
+        return f.T
+
+
+class ThompsonDensity(TensorManager):
+    def __init__(self, paths, weights, lengthscales, X_init, memory_budget=2**28):
+        """
+        Kernel-smoothed density of the maximisers of GP sample paths, i.e. of Thompson sampling.
+        The maximiser of each path is searched once over a fixed pool of inputs (always including X_init),
+        and the density at x is the weighted frequency of the maximisers smoothed by a Gaussian kernel,
+        sum_j w_j exp(-|(x - x*_j) / l_j|^2 / 2), which is w_j at the maximiser x*_j itself.
+        The density does not change between the calls until refresh, so the weights computed
+        in different rounds or chunks are measured against the same target.
+
+        Args:
+        - paths: function, evaluating the sample paths at inputs. torch.Size(n_data, n_dims) -> torch.Size(n_paths, n_data)
+        - weights: torch.tensor, the weights of the paths summing to one. torch.Size(n_paths)
+        - lengthscales: torch.tensor, the smoothing lengthscales of each path. torch.Size(n_paths, n_dims) or broadcastable
+        - X_init: torch.tensor, the inputs always included in the pool, e.g. the observed inputs
+        - memory_budget: int, the memory budget of a block of the density evaluation [bytes]
+        """
+        super().__init__() # call TensorManager
+        self.paths = paths
+        self.weights = weights
+        self.lengthscales = lengthscales.expand(len(weights), X_init.shape[-1])
+        self.memory_budget = memory_budget
+        self.X_init = X_init
+        self.refresh()
+
+    def block_size(self, X, n_columns):
+        """
+        The number of rows of X evaluated at once within the memory budget
+
+        Args:
+        - X: torch.tensor, inputs. torch.Size(n_data, n_dims)
+        - n_columns: int, the number of elements per row of the block
+
+        Return:
+        - block_size: int, the number of rows per block
+        """
+        return max(1, int(self.memory_budget // (n_columns * X.element_size())))
+
+    def refresh(self, X_pool=None):
+        """
+        Search the maximiser of each path over the fixed pool X_init and X_pool from scratch.
+        Call this once per iteration, e.g. with a pool drawn from the prior, before computing any weights.
+
+        Args:
+        - X_pool: torch.tensor, additional inputs. torch.Size(n_data, n_dims). Only X_init if None.
+        """
+        X = self.X_init if X_pool is None else torch.vstack([self.X_init, X_pool])
+        best_values, best_inputs = None, None
+        with torch.no_grad():
+            for X_block in torch.split(X, self.block_size(X, len(self.weights))):
+                values, idx = self.paths(X_block).max(dim=1)
+                if best_values is None:
+                    best_values, best_inputs = values, X_block[idx]
+                else:
+                    improved = values > best_values
+                    best_values = torch.where(improved, values, best_values)
+                    best_inputs = torch.where(improved.unsqueeze(1), X_block[idx], best_inputs)
+        self.best_values = best_values
+        self.best_inputs = best_inputs
+
+    def __call__(self, X, log=False):
+        """
+        Evaluate the density at X with the maximisers of the last refresh
+
+        Args:
+        - X: torch.tensor, inputs. torch.Size(n_data, n_dims)
+        - log: bool: return log value if true, otherwise not.
+
+        Return:
+        - density: torch.tensor, the density at X. torch.Size(n_data)
+        """
+        density = []
+        for X_block in torch.split(X, self.block_size(X, self.lengthscales.numel())):
+            Z = (X_block.unsqueeze(1) - self.best_inputs.unsqueeze(0)) / self.lengthscales.unsqueeze(0)
+            density.append((-0.5 * Z.pow(2).sum(-1)).exp() @ self.weights)
+        density = torch.cat(density)
+        if log:
+            return (density + torch.finfo().eps).log()
+        else:
+            return density
@@ -1,6 +1,11 @@
+import os
+import copy
+import time
 import torch
 import warnings
 import gpytorch
+from weakref import WeakKeyDictionary
+from collections import OrderedDict
 from botorch.fit import fit_gpytorch_model
 from gpytorch.priors.torch_priors import GammaPrior
 
@@ -155,7 +160,7 @@ def train_GP_with_Adam(mll, lr, training_iter, thresh):
     return mll
 
 
-def train_GP(model, training_iter=50, thresh=0.01, lr=0.1, optimiser="BoTorch"):
+def train_GP(model, training_iter=50, thresh=0.01, lr=0.1, optimiser="BoTorch", n_restarts=1, n_workers=None, initial_state=None):
     """
     Args:
         - model: gpytorch.models, function of GP model.
@@ -163,30 +168,189 @@ def train_GP(model, training_iter=50, thresh=0.01, lr=0.1, optimiser="BoTorch"):
         - thresh: float, the threshold as a stopping criterion of GP hyperparameter training.
         - lr: float, the learning rate of Adam optimiser
         - optimiser: string, select the optimiser ["L-BFGS-B", "BoTorch", "Adam"]
+        - n_restarts: int, the number of restarts. If larger than 1, see train_GP_multistart.
+                      The report of the restarts is stored as model.fit_report.
+        - n_workers: int, the number of worker processes for the restarts
+        - initial_state: dict, the state_dict to start from, e.g. of the previous model. The current state if None.
 
     Returns:
         - model: gpytorch.models, function of GP model.
     """
+    if n_restarts > 1:
+        model, report = train_GP_multistart(
+            model, n_restarts=n_restarts, n_workers=n_workers, training_iter=training_iter,
+            thresh=thresh, lr=lr, optimiser=optimiser, initial_state=initial_state,
+        )
+        model.fit_report = report
+        return model
+
+    if initial_state is not None:
+        model.load_state_dict(initial_state)
+
     model.train()
     model.likelihood.train()
     mll = gpytorch.mlls.ExactMarginalLogLikelihood(model.likelihood, model)
     try:
-        if optimiser == "BoTorch":
-            mll = fit_gpytorch_model(mll)
-        elif optimiser == "L-BFGS-B":
-            mll = train_GP_with_BFGS(mll, training_iter, thresh)
-
-        elif optimiser == "Adam":
-            mll = train_GP_with_Adam(mll, lr, training_iter, thresh)
-        else:
-            raise Exception("The given optimiser is not defined")
+        run_optimiser(mll, training_iter, thresh, lr, optimiser)
     except:
         warnings.warn("Optimiser " + optimiser + " failed. Optimising again with Adam...")
         mll = train_GP_with_Adam(mll, lr, training_iter, thresh)
     return model
 
 
-def update_gp(train_x, train_y, gp_kernel, device, lik=1e-10, training_iter=50, thresh=0.01, lr=0.1, rng=10, train_lik=False, optimiser="BoTorch"):
+def run_optimiser(mll, training_iter, thresh, lr, optimiser):
+    """
+    Args:
+        - mll: gpytorch.mlls.ExactMarginalLogLikelihood, marginal log likelihood
+        - others: see train_GP
+
+    Returns:
+        - mll: gpytorch.mlls.ExactMarginalLogLikelihood, marginal log likelihood
+    """
+    if optimiser == "BoTorch":
+        mll = fit_gpytorch_model(mll)
+    elif optimiser == "L-BFGS-B":
+        mll = train_GP_with_BFGS(mll, training_iter, thresh)
+    elif optimiser == "Adam":
+        mll = train_GP_with_Adam(mll, lr, training_iter, thresh)
+    else:
+        raise Exception("The given optimiser is not defined")
+    return mll
+
+
+def sample_initial_hyperparameters(model):
+    """
+    Draw the initial kernel hyperparameters from the GammaPriors set in set_gp.
+    Hyperparameters without a prior are kept.
+
+    Args:
+        - model: gpytorch.models, function of GP model.
+
+    Returns:
+        - state_dict: dict, the state of the model with the sampled hyperparameters
+    """
+    model_init = copy.deepcopy(model)
+    covar_module = model_init.covar_module
+    lengthscale_prior = getattr(covar_module.base_kernel, "lengthscale_prior", None)
+    outputscale_prior = getattr(covar_module, "outputscale_prior", None)
+    with torch.no_grad():
+        if lengthscale_prior is not None:
+            lengthscale = covar_module.base_kernel.lengthscale
+            covar_module.base_kernel.lengthscale = lengthscale_prior.sample(lengthscale.shape).to(lengthscale)
+        if outputscale_prior is not None:
+            outputscale = covar_module.outputscale
+            covar_module.outputscale = outputscale_prior.sample(outputscale.shape).to(outputscale)
+    return model_init.state_dict()
+
+
+def _initialise_fit_worker(n_threads):
+    """
+    Limit the number of threads per worker process to avoid oversubscription.
+    """
+    torch.set_num_threads(n_threads)
+
+
+def _fit_restart(model, state_dict, training_iter, thresh, lr, optimiser):
+    """
+    Fit the hyperparameters from a given initial state. A failed optimiser is not retried with Adam,
+    but reported as not converged.
+
+    Returns:
+        - state_dict: dict, the state of the fitted model
+        - mll_value: float, the marginal log likelihood after fitting
+        - interval: float, the wall-clock time [s]
+        - converged: bool, whether or not the optimiser finished without errors
+    """
+    start = time.monotonic()
+    model.load_state_dict(state_dict)
+    model.train()
+    model.likelihood.train()
+    mll = gpytorch.mlls.ExactMarginalLogLikelihood(model.likelihood, model)
+    try:
+        run_optimiser(mll, training_iter, thresh, lr, optimiser)
+        converged = True
+    except Exception:
+        converged = False
+
+    with torch.no_grad():
+        try:
+            mll_value = mll(model(*model.train_inputs), model.train_targets).sum().item()
+        except Exception:
+            mll_value = -float("inf")
+    if not mll_value == mll_value:  # NaN
+        mll_value = -float("inf")
+    converged = converged and mll_value > -float("inf")
+    return model.state_dict(), mll_value, time.monotonic() - start, converged
+
+
+def train_GP_multistart(model, n_restarts=4, n_workers=None, training_iter=50, thresh=0.01, lr=0.1, optimiser="BoTorch", start_method="spawn", initial_state=None):
+    """
+    Fit the hyperparameters from several initial states over a process pool, and keep the best marginal likelihood.
+    The first restart starts from initial_state if given (reported as "previous"), otherwise from the current
+    hyperparameters of the model (reported as "current"), and the others start from the draws of the GammaPriors
+    set in set_gp (reported as "prior").
+    Runs in the main process on CUDA or if n_workers < 2.
+    If all the restarts fail, the model is optimised with Adam from the current hyperparameters.
+
+    Args:
+        - model: gpytorch.models, function of GP model.
+        - n_restarts: int, the number of restarts
+        - n_workers: int, the number of worker processes. If None, min(n_restarts, the number of CPU cores) are used.
+        - start_method: string, the start method of multiprocessing. "spawn" by default as in recombination_parallel,
+                        since forking after torch / OpenMP threads have started can deadlock. The model must be picklable,
+                        and the caller's script must be guarded by if __name__ == "__main__". None for the platform default.
+        - initial_state: dict, the state_dict of the previous model to start the first restart from
+        - others: see train_GP
+
+    Returns:
+        - model: gpytorch.models, function of GP model.
+        - report: list, dicts of "init", "mll", "time" and "converged" for each restart
+    """
+    model.train()
+    model.likelihood.train()
+    if initial_state is None:
+        first_init = "current"
+        initial_states = [copy.deepcopy(model.state_dict())]
+    else:
+        first_init = "previous"
+        initial_states = [copy.deepcopy(initial_state)]
+    initial_states += [sample_initial_hyperparameters(model) for _ in range(n_restarts - 1)]
+    args = [(model, state, training_iter, thresh, lr, optimiser) for state in initial_states]
+
+    if n_workers is None:
+        n_workers = min(n_restarts, os.cpu_count())
+    n_workers = min(n_workers, n_restarts)
+    is_cuda = model.train_inputs[0].is_cuda
+    if is_cuda or n_workers < 2:
+        results = [_fit_restart(copy.deepcopy(model), *arg[1:]) for arg in args]
+    else:
+        n_threads = max(1, torch.get_num_threads() // n_workers)
+        context = torch.multiprocessing.get_context(start_method)
+        with context.Pool(n_workers, initializer=_initialise_fit_worker, initargs=(n_threads,)) as pool:
+            results = pool.starmap(_fit_restart, args)
+
+    report = [
+        {
+            "init": first_init if i == 0 else "prior",
+            "mll": mll_value,
+            "time": interval,
+            "converged": converged,
+        }
+        for i, (_, mll_value, interval, converged) in enumerate(results)
+    ]
+    candidates = [i for i, result in enumerate(results) if result[3]]
+    if len(candidates) == 0:
+        warnings.warn("All the restarts failed. Optimising again with Adam...")
+        mll = gpytorch.mlls.ExactMarginalLogLikelihood(model.likelihood, model)
+        train_GP_with_Adam(mll, lr, training_iter, thresh)
+        return model, report
+
+    idx_best = max(candidates, key=lambda i: results[i][1])
+    model.load_state_dict(results[idx_best][0])
+    return model, report
+
+
+def update_gp(train_x, train_y, gp_kernel, device, lik=1e-10, training_iter=50, thresh=0.01, lr=0.1, rng=10, train_lik=False, optimiser="BoTorch", n_restarts=1, n_workers=None, initial_state=None):
     """
     Input:
         - train_x: torch.tensor, inputs. torch.Size(n_data, n_dims)
@@ -200,19 +364,219 @@ def update_gp(train_x, train_y, gp_kernel, device, lik=1e-10, training_iter=50,
         - rng: int, tne range coefficient of GP likelihood noise variance
         - train_like: bool, flag whether or not to update GP likelihood noise variance
         - optimiser: string, select the optimiser ["L-BFGS-B", "BoTorch", "Adam"]
+        - n_restarts: int, the number of restarts of hyperparameter training, see train_GP_multistart
+        - n_workers: int, the number of worker processes for the restarts
+        - initial_state: dict, the state_dict of the previous model to warm-start the training from.
+                         If None, the training starts from the defaults of set_gp.
 
     Output:
         - model: gpytorch.models, function of GP model.
     """
     model = set_gp(train_x, train_y, gp_kernel, device, lik=lik, rng=rng, train_lik=train_lik)
-    model = train_GP(model, training_iter=training_iter, thresh=thresh, lr=lr, optimiser=optimiser)
+    model = train_GP(
+        model, training_iter=training_iter, thresh=thresh, lr=lr, optimiser=optimiser,
+        n_restarts=n_restarts, n_workers=n_workers, initial_state=initial_state,
+    )
     return model
 
 
+def update_gp_incremental(model, train_x, train_y, gp_kernel, device, refit=False, lik=1e-10, training_iter=50, thresh=0.01, lr=0.1, rng=10, train_lik=False, optimiser="BoTorch", n_restarts=1, n_workers=None, targets_unchanged=None):
+    """
+    Update the GP model with a new batch without rebuilding it from the defaults.
+    If the hyperparameters are kept (refit=False) and the observations of the existing data are unchanged,
+    the Cholesky factor of the Gram matrix is extended with a block rank-k update via the fantasy model of gpytorch,
+    which costs O(n^2 k) instead of O(n^3) for k new observations.
+    If the existing observations were changed (e.g. the warping of y was updated), the Gram matrix is refactorised
+    with the previous hyperparameters. If refit=True, the hyperparameter optimiser is warm-started from the previous values.
+
+    Input:
+        - model: gpytorch.models, the current GP model trained on the leading rows of train_x
+        - train_x: torch.tensor, all the inputs. torch.Size(n_data, n_dims)
+        - train_y: torch.tensor, all the observations
+        - gp_kernel: gpytorch.kernels, GP kernel model
+        - device: torch.device, cpu or cuda
+        - refit: bool, flag whether or not to retrain the hyperparameters
+        - targets_unchanged: bool, whether the observations of the existing data are unchanged.
+                             If None, they are compared with the leading rows of train_y.
+        - others: see update_gp
+
+    Output:
+        - model: gpytorch.models, function of GP model.
+    """
+    n_obs = len(model.train_inputs[0])
+    if targets_unchanged is None:
+        targets_unchanged = torch.equal(model.train_targets.view(-1), train_y[:n_obs])
+    is_extension = (
+        len(train_x) > n_obs
+        and torch.equal(model.train_inputs[0], train_x[:n_obs])
+        and targets_unchanged
+    )
+    if not refit and is_extension:
+        get_cov_root(model)  # the caches of the prediction strategy are required for the block update
+        with torch.no_grad():
+            return model.get_fantasy_model(train_x[n_obs:], train_y[n_obs:])
+
+    model_new = set_gp(train_x, train_y, gp_kernel, device, lik=lik, rng=rng, train_lik=train_lik)
+    model_new.load_state_dict(model.state_dict())
+    if refit:
+        model_new = train_GP(
+            model_new, training_iter=training_iter, thresh=thresh, lr=lr, optimiser=optimiser,
+            n_restarts=n_restarts, n_workers=n_workers, initial_state=model.state_dict(),
+        )
+    return model_new
+
+
+def update_warped_gp(surrogate, train_x, train_y, warping_unchanged, incremental=False, refit=False, n_restarts=1, n_workers=None):
+    """
+    Update the GP model of a surrogate whose observations are warped with a data-dependent parameter,
+    such as alpha of WSABI or the scaling beta of BQ models, and set it as surrogate.model.
+    With incremental=True, the block rank-k update is used only if the warping parameter is unchanged,
+    since otherwise every existing warped observation has changed. In that case, the Gram matrix is refactorised
+    with the previous hyperparameters (or retrained from them if refit=True), see update_gp_incremental.
+    With incremental=False, the GP model is rebuilt and retrained via update_gp, warm-started from
+    the hyperparameters of the current model, i.e. of the previous iteration.
+
+    Input:
+        - surrogate: class, the surrogate holding model, gp_kernel, device and the training settings
+        - train_x: torch.tensor, all the inputs
+        - train_y: torch.tensor, all the warped observations
+        - warping_unchanged: bool, whether the warping parameter is the same as in the current model
+        - incremental: bool, update the existing GP model instead of rebuilding it from the defaults
+        - refit: bool, flag whether or not to retrain the hyperparameters in the incremental update
+        - n_restarts: int, the number of restarts of hyperparameter training, see train_GP_multistart
+        - n_workers: int, the number of worker processes for the restarts
+    """
+    options = dict(
+        lik=surrogate.lik,
+        training_iter=surrogate.training_iter,
+        thresh=surrogate.thresh,
+        lr=surrogate.lr,
+        rng=surrogate.rng,
+        train_lik=surrogate.train_lik,
+        optimiser=surrogate.optimiser,
+        n_restarts=n_restarts,
+        n_workers=n_workers,
+    )
+    if incremental:
+        surrogate.model = update_gp_incremental(
+            surrogate.model, train_x, train_y, surrogate.gp_kernel, surrogate.device,
+            refit=refit, targets_unchanged=warping_unchanged, **options,
+        )
+        surrogate.gp_kernel = surrogate.model.covar_module
+    else:
+        surrogate.model = update_gp(
+            train_x, train_y, surrogate.gp_kernel, surrogate.device,
+            initial_state=surrogate.model.state_dict(), **options,
+        )
+
+
+class Predictor:
+    fallbacks = ["fast_pred_var", "exact", "jitter"]
+
+    def __init__(self, model, memory_budget=2**28):
+        """
+        Blocked GP prediction within a memory budget.
+        The inputs are split into blocks so that the cross-covariance against the observed data fits in the budget,
+        and the LOVE / prediction caches of the model are computed once and reused across the blocks.
+        The fallback that succeeded (fast_pred_var, exact, jitter) is remembered, and the failed ones are skipped
+        in the later calls until the prediction strategy of the model is rebuilt (e.g. after retraining).
+
+        Args:
+        - model: gpytorch.models, function of GP model
+        - memory_budget: int, the memory budget of a block [bytes]
+        """
+        self.model = model
+        self.memory_budget = memory_budget
+        self.mode = None
+        self.strategy = None
+
+    def block_size(self, test_x):
+        """
+        Args:
+        - test_x: torch.tensor, inputs. torch.Size(n_data, n_dims)
+
+        Return:
+        - block_size: int, the number of rows predicted at once
+        """
+        n_obs = len(self.model.train_inputs[0])
+        bytes_per_row = 4 * (n_obs + test_x.shape[-1]) * test_x.element_size()
+        return max(1, int(self.memory_budget // bytes_per_row))
+
+    def predict_block(self, test_x, mode):
+        """
+        Args:
+        - test_x: torch.tensor, inputs
+        - mode: string, select from ["fast_pred_var", "exact", "jitter"]
+
+        Return:
+        - pred.mean; torch.tensor, the predictive mean
+        - pred.variance; torch.tensor, the predictive variance
+        """
+        if mode == "fast_pred_var":
+            with gpytorch.settings.fast_pred_var():
+                pred = self.model.likelihood(self.model(test_x))
+        elif mode == "exact":
+            pred = self.model.likelihood(self.model(test_x))
+        elif mode == "jitter":
+            with gpytorch.settings.cholesky_jitter(float_value=1e-2):
+                pred = self.model.likelihood(self.model(test_x))
+        else:
+            raise ValueError('mode should be from ["fast_pred_var", "exact", "jitter"]')
+        return pred.mean, pred.variance
+
+    def __call__(self, test_x):
+        """
+        Args:
+        - test_x: torch.tensor, inputs. torch.Size(n_data, n_dims)
+
+        Return:
+        - mean; torch.tensor, the predictive mean
+        - variance; torch.tensor, the predictive variance
+        """
+        self.model.eval()
+        self.model.likelihood.eval()
+        if self.strategy is None or not self.strategy is self.model.prediction_strategy:
+            self.mode = None
+        start = 0 if self.mode is None else self.fallbacks.index(self.mode)
+
+        means, variances = [], []
+        with torch.no_grad():
+            for x_block in torch.split(test_x, self.block_size(test_x)):
+                for i, mode in enumerate(self.fallbacks[start:], start):
+                    try:
+                        mean, variance = self.predict_block(x_block, mode)
+                        break
+                    except Exception:
+                        if i == len(self.fallbacks) - 1:
+                            raise
+                        if mode == "exact":
+                            warnings.warn("Cholesky failed. Adding more jitter...")
+                start = i
+                means.append(mean)
+                variances.append(variance)
+        self.mode = self.fallbacks[start]
+        self.strategy = self.model.prediction_strategy
+        return torch.cat(means), torch.cat(variances)
+
+
+_predictors = WeakKeyDictionary()
+
+def get_predictor(model):
+    """
+    Input:
+        - model: gpytorch.models, function of GP model.
+
+    Output:
+        - predictor: class, the Predictor of the model, shared across the calls of predict
+    """
+    if model not in _predictors:
+        _predictors[model] = Predictor(model)
+    return _predictors[model]
+
 def predict(test_x, model):
     """
     Fast variance inference is made with LOVE via fast_pred_var().
-    For accurate variance inference, you can just comment out the part.
+    The inputs are predicted in blocks, and the failed fallbacks are skipped, see Predictor.
 
     Input:
         - model: gpytorch.models, function of GP model.
@@ -221,21 +585,7 @@ def predict(test_x, model):
         - pred.mean; torch.tensor, the predictive mean
         - pred.variance; torch.tensor, the predictive variance
     """
-    model.eval()
-    model.likelihood.eval()
-
-    with torch.no_grad():
-        try:
-            with gpytorch.settings.fast_pred_var():
-                pred = model.likelihood(model(test_x))
-        except:
-            try:
-                pred = model.likelihood(model(test_x))
-            except:
-                warnings.warn("Cholesky failed. Adding more jitter...")
-                with gpytorch.settings.cholesky_jitter(float_value=1e-2):
-                    pred = model.likelihood(model(test_x))
-    return pred.mean, pred.variance
+    return get_predictor(model)(test_x)
 
 def predict_mean(test_x, model):
     """
@@ -252,16 +602,15 @@ def predict_mean(test_x, model):
     pred_mean, _ = predict(test_x, model)
     return pred_mean
 
-def get_cov_cache(model):
+def get_cov_root(model):
     """
-    woodbury_inv = K(Xobs, Xobs)^(-1)
-    S @ S.T = woodbury_inv
+    S @ S.T = K(Xobs, Xobs)^(-1)
 
     Input:
         - model: gpytorch.models, function of GP model, typically self.wsabi.model in _basq.py
 
     Output:
-        - woodbury_inv: torch.tensor, the inverse of Gram matrix K(Xobs, Xobs)^(-1)
+        - S: torch.tensor, the root of the inverse of Gram matrix K(Xobs, Xobs)^(-1)
         - Xobs: torch.tensor, the observed inputs X
         - lik_var: torch.tensor, the GP likelihood noise variance
     """
@@ -274,6 +623,23 @@ def get_cov_cache(model):
         mean = Xobs[0].unsqueeze(0)
         model(mean)
         S = model.prediction_strategy.covar_cache
+    return S, Xobs, lik_var
+
+
+def get_cov_cache(model):
+    """
+    woodbury_inv = K(Xobs, Xobs)^(-1)
+    S @ S.T = woodbury_inv
+
+    Input:
+        - model: gpytorch.models, function of GP model, typically self.wsabi.model in _basq.py
+
+    Output:
+        - woodbury_inv: torch.tensor, the inverse of Gram matrix K(Xobs, Xobs)^(-1)
+        - Xobs: torch.tensor, the observed inputs X
+        - lik_var: torch.tensor, the GP likelihood noise variance
+    """
+    S, Xobs, lik_var = get_cov_root(model)
     woodbury_inv = S @ S.T
     return woodbury_inv, Xobs, lik_var
 
@@ -288,11 +654,11 @@ def predictive_covariance(x, y, model):
     Output:
         - cov_xy: torch.tensor, predictive covariance matrix
     """
-    woodbury_inv, Xobs, lik_var = get_cov_cache(model)
+    S, Xobs, lik_var = get_cov_root(model)
     Kxy = model.covar_module.forward(x, y)
-    KxX = model.covar_module.forward(x, Xobs)
-    KXy = model.covar_module.forward(Xobs, y)
-    cov_xy = Kxy - KxX @ woodbury_inv @ KXy
+    A_x = S.T @ model.covar_module.forward(Xobs, x)
+    A_y = A_x if x is y else S.T @ model.covar_module.forward(Xobs, y)
+    cov_xy = Kxy - A_x.transpose(-1, -2) @ A_y
 
     """
     if len(x.shape) == 3 or len(y.shape) == 3:
@@ -303,3 +669,97 @@ def predictive_covariance(x, y, model):
         cov_xy[range(d), range(d)] += lik_var
     """
     return cov_xy
+
+
+class PredictiveCovarianceCache:
+    def __init__(self, model, max_entries=8, max_rows=10000):
+        """
+        Predictive covariance with cached low-rank projections.
+        The projections A_x = S.T @ K(Xobs, x) of recently seen inputs are stored,
+        where S @ S.T = K(Xobs, Xobs)^(-1), then cov_xy = K(x, y) - A_x.T @ A_y.
+        The cache is cleared whenever the training state of the model changes.
+        
+        Args:
+            - model: gpytorch.models, function of GP model.
+            - max_entries: int, the maximum number of cached inputs
+            - max_rows: int, the maximum number of rows of the inputs to be cached
+        """
+        self.model = model
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.state = None
+        self.projections = OrderedDict()
+        
+    def tensor_key(self, x):
+        """
+        Input:
+            - x: torch.tensor, inputs x
+
+        Output:
+            - key: tuple, the key identifying the storage and the contents version of x
+        """
+        return (x.data_ptr(), x.storage_offset(), tuple(x.shape), x.stride(), x._version, x.dtype, x.device)
+    
+    def refresh(self):
+        """
+        Clear the cache if the training state of the model has changed.
+        The referred tensors are kept in self.state so that their identities are never reused.
+        """
+        S, Xobs, _ = get_cov_root(self.model)
+        state = (S, Xobs, self.tensor_key(Xobs))
+        if (self.state is None) or not (
+            self.state[0] is S and self.state[1] is Xobs and self.state[2] == state[2]
+        ):
+            self.projections.clear()
+        self.state = state
+        return S, Xobs
+    
+    def projection(self, x):
+        """
+        Input:
+            - x: torch.tensor, inputs x
+
+        Output:
+            - A_x: torch.tensor, the projection S.T @ K(Xobs, x)
+        """
+        S, Xobs = self.refresh()
+        cacheable = (x.dim() == 2) and (len(x) <= self.max_rows)
+        if cacheable:
+            key = self.tensor_key(x)
+            if key in self.projections:
+                self.projections.move_to_end(key)
+                return self.projections[key][1]
+        
+        A_x = S.T @ self.model.covar_module.forward(Xobs, x)
+        if cacheable:
+            # keep x referenced, so that its storage is not reused while cached
+            self.projections[key] = (x, A_x)
+            if len(self.projections) > self.max_entries:
+                self.projections.popitem(last=False)
+        return A_x
+    
+    def __call__(self, x, y):
+        """
+        Input:
+            - x: torch.tensor, inputs x
+            - y: torch.tensor, inputs y
+
+        Output:
+            - cov_xy: torch.tensor, predictive covariance matrix
+        """
+        A_x = self.projection(x)
+        if x is y:
+            return self.model.covar_module.forward(x, x) - A_x.transpose(-1, -2) @ A_x
+        A_y = self.projection(y)
+        return self.model.covar_module.forward(x, y) - A_x.transpose(-1, -2) @ A_y
+    
+    def diag(self, x):
+        """
+        Input:
+            - x: torch.tensor, inputs x
+
+        Output:
+            - var: torch.tensor, the diagonal of predictive covariance matrix
+        """
+        A_x = self.projection(x)
+        return self.model.covar_module.forward(x, x, diag=True) - A_x.pow(2).sum(axis=-2)
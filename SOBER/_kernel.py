@@ -1,17 +1,23 @@
-from ._gp import predictive_covariance, predict_mean
+import torch
+from ._gp import predict_mean, PredictiveCovarianceCache
+from ._rff import RandomFourierFeatures
 import torch.distributions as D
 
 class Kernel:
-    def __init__(self, model, mode="predictive_covariance"):
+    def __init__(self, model, mode="predictive_covariance", n_features=1024):
         """
         Definition of kernel for recombination.
         
         Args:
         - model: gpytorch.models, function of GP model
-        - mode: string, select from ["predictive_covariance", "weighted_predictive_covariance", "kernel"]
+        - mode: string, select from ["predictive_covariance", "weighted_predictive_covariance", "kernel", "rff"]
+        - n_features: int, the number of random Fourier features, used only for mode "rff"
         """
         self.model = model
         self.mode = mode
+        self.cov_cache = PredictiveCovarianceCache(model)
+        if mode == "rff":
+            self.set_rff(n_features)
     
     def __call__(self, x, y):
         """
@@ -21,15 +27,83 @@ class Kernel:
         - CLy: torch.tensor, the Gram matrix with the posterior predictive covariance
         """
         if self.mode == "predictive_covariance":
-            return predictive_covariance(x, y, self.model)
+            return self.cov_cache(x, y)
         elif self.mode == "weighted_predictive_covariance":
             return self.weighted_covariance(x, y)
         elif self.mode == "kernel":
             return self.model.covar_module.forward(x, y)
+        elif self.mode == "rff":
+            return self.features(x) @ self.features(y).transpose(-1, -2)
         else:
-            raise ValueError('mode should be from ["predictive_covariance", "weighted_predictive_covariance", "kernel"]')
+            raise ValueError('mode should be from ["predictive_covariance", "weighted_predictive_covariance", "kernel", "rff"]')
             
     
+    def diag(self, x):
+        """
+        Compute the diagonal of the Gram matrix without computing the full matrix
+        
+        Return:
+        - diag: torch.tensor, the diagonal of the Gram matrix K(x, x)
+        """
+        if self.mode == "kernel":
+            return self.model.covar_module.forward(x, x, diag=True)
+        elif self.mode in ["predictive_covariance", "weighted_predictive_covariance"]:
+            var = self.cov_cache.diag(x)
+            if self.mode == "weighted_predictive_covariance":
+                var = predict_mean(x, self.model).pow(2) * var
+            return var
+        elif self.mode == "rff":
+            return self.features(x).pow(2).sum(-1)
+        else:
+            raise ValueError('mode should be from ["predictive_covariance", "weighted_predictive_covariance", "kernel", "rff"]')
+    
+    def set_rff(self, n_features):
+        """
+        Set up the random Fourier features and the Cholesky factor of the weight-space posterior.
+        With the features Phi of the observed inputs and the noise variance s2,
+        the posterior covariance of the weights is s2 (Phi^T Phi + s2 I)^{-1} = s2 R^{-T} R^{-1},
+        so the posterior covariance features are psi(x) = s R^{-1} phi(x).
+        
+        Args:
+        - n_features: int, the number of random Fourier features
+        """
+        Xobs = self.model.train_inputs[0]
+        self.rff = RandomFourierFeatures(self.model.covar_module, Xobs.shape[-1], n_features)
+        self.refresh_rff()
+    
+    def refresh_rff(self):
+        """
+        Recompute the Cholesky factor after the hyperparameters or the observations of the GP model are updated.
+        The spectral samples are kept fixed.
+        If the factorisation fails, the jitter is treated as additional noise variance,
+        so that the features stay consistent with s2 (Phi^T Phi + s2 I)^{-1} for the inflated s2.
+        """
+        Xobs = self.model.train_inputs[0]
+        noise = self.model.likelihood.noise.detach().squeeze()
+        Phi = self.rff(Xobs)
+        eye = torch.eye(Phi.shape[1], dtype=Phi.dtype, device=Phi.device)
+        A = Phi.T @ Phi
+        R, info = torch.linalg.cholesky_ex(A + noise * eye)
+        if info > 0:
+            noise = noise + 1e-6 * (A.diagonal().mean() + noise)
+            R = torch.linalg.cholesky(A + noise * eye)
+        self.rff_root = R
+        self.rff_scale = noise.sqrt()
+    
+    def features(self, x):
+        """
+        Compute the posterior covariance features, such that K(x, y) ≈ features(x) @ features(y).T
+        
+        Args:
+        - x: torch.tensor, inputs. torch.Size(..., n_data, n_dims)
+        
+        Return:
+        - psi: torch.tensor, the features. torch.Size(..., n_data, n_features)
+        """
+        phi = self.rff(x)
+        psi = torch.linalg.solve_triangular(self.rff_root, phi.transpose(-1, -2), upper=False)
+        return self.rff_scale * psi.transpose(-1, -2)
+    
     def weighted_covariance(self, x, y):
         """
         Compute the mean weighted Gram matrix
@@ -39,7 +113,7 @@ class Kernel:
         """
         mu_x = predict_mean(x, self.model)
         mu_y = predict_mean(y, self.model)
-        cov_xy = predictive_covariance(x, y, self.model)
+        cov_xy = self.cov_cache(x, y)
         if len(mu_x.shape) == 1 and len(mu_y.shape) == 1:
             CLy = mu_x.unsqueeze(1) * cov_xy * mu_y.unsqueeze(0)
         else:
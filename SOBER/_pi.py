@@ -1,9 +1,74 @@
-from ._gp import predict
+import torch
+from weakref import WeakKeyDictionary
+import warnings
+from ._gp import Predictor, get_cov_root, predict_mean
+from ._decoupled_sampler import DecoupledSampler, ThompsonDensity
 import torch.distributions as D
 
+_eta_cache = WeakKeyDictionary()
 
-class PI:
-    def __init__(self, model, label="lfi"):
+def get_eta(model):
+    """
+    Compute the current maximum of the posterior mean over the observed inputs.
+    The value is cached per model, and recomputed only when the prediction strategy is rebuilt.
+    If the cached training factors are unavailable, the posterior mean is predicted with gpytorch instead.
+    
+    Args:
+    - model: gpytorch.models, function of GP model
+    
+    Return:
+    - eta: float, the current maximum
+    """
+    try:
+        _, Xobs, _ = get_cov_root(model)
+        strategy = model.prediction_strategy
+        mean_cache = strategy.mean_cache
+    except (AttributeError, RuntimeError) as error:
+        warnings.warn(f"the cached training factors are unavailable ({error}), predicting eta instead")
+        return predict_mean(model.train_inputs[0], model).max().item()
+    cached = _eta_cache.get(model)
+    if cached is not None and cached[0] is strategy:
+        return cached[1]
+    
+    with torch.no_grad():
+        mean_obs = model.mean_module(Xobs) + model.covar_module.forward(Xobs, Xobs) @ mean_cache
+    eta = mean_obs.max().item()
+    _eta_cache[model] = (strategy, eta)
+    return eta
+
+
+class ThompsonSampling:
+    """
+    The shared TS of PI, PI_FBGP and PI_BQ, as the density of the maximisers of the sample paths in self.ts_density.
+    """
+    def refresh(self, X_pool=None):
+        """
+        Search the maximisers of the sample paths over the fixed pool X_pool once per iteration,
+        see ThompsonDensity.refresh. pi stays unchanged until the next refresh. No-op for LFI.
+        
+        Args:
+        - X_pool: torch.tensor, the pool of inputs, e.g. drawn from the prior
+        """
+        if self.label == "ts":
+            self.ts_density.refresh(X_pool)
+    
+    def ts(self, X_cand, log=False):
+        """
+        Compute TS at given locations X_cand, the kernel-smoothed density of the maximisers of the sample paths,
+        see ThompsonDensity. The maximisers are fixed at initialisation or by refresh, so TS is a pure function of X_cand.
+        
+        Args:
+        - X_cand: torch.tensor, inputs X where to compute TS
+        - log: bool: return log value if true, otherwise not.
+        
+        Return:
+        - ts: torch.tensor, the TS values at X_cand
+        """
+        return self.ts_density(X_cand, log=log)
+
+
+class PI(ThompsonSampling):
+    def __init__(self, model, label="lfi", memory_budget=2**28, fused=True, n_samples=64, n_features=1024):
         """
         Definition of pi (feasible resion).
         Select TS (Thompson Sampling) or LFI (likelihood-free inference)
@@ -11,11 +76,53 @@ class PI:
         Args:
         - model: gpytorch.models, function of GP model
         - label: string, "ts" or "lfi"
+        - memory_budget: int, the memory budget of a block of prediction [bytes], see Predictor
+        - fused: bool, compute LFI with the fused evaluator if true, see posterior_fused.
+                 If the cached training factors are unavailable, it warns once and falls back to Predictor.
+        - n_samples: int, the number of sample paths for TS
+        - n_features: int, the number of random Fourier features of the sample paths for TS
         """
         self.model = model
+        self.predictor = Predictor(model, memory_budget=memory_budget)
+        self.fused = fused
         self.Xobs = model.train_inputs[0]    # training data X_obs
-        self.eta = self.model.likelihood(self.model(self.Xobs)).loc.max().item() # current maximum
+        self.eta = get_eta(model) # current maximum
         self.label = label
+        if label == "ts":
+            self.sampler = DecoupledSampler(model, n_samples=n_samples, n_features=n_features)
+            self.ts_density = ThompsonDensity(
+                self.sampler,
+                torch.full((n_samples,), 1 / n_samples, dtype=self.Xobs.dtype, device=self.Xobs.device),
+                model.covar_module.base_kernel.lengthscale.detach().view(1, -1),
+                self.Xobs,
+                memory_budget=memory_budget,
+            )
+    
+    def posterior_fused(self, X_cand):
+        """
+        Compute the predictive mean and variance with the cached training factors of the model,
+        without constructing gpytorch distributions. With alpha = K^(-1) y and S @ S.T = K^(-1),
+        mean = m(x) + K(x, Xobs) @ alpha and var = k(x, x) - |K(x, Xobs) @ S|^2 + noise.
+        
+        Args:
+        - X_cand: torch.tensor, inputs X where to compute the posterior
+        
+        Return:
+        - mu_pred: torch.tensor, the predictive mean
+        - var_pred: torch.tensor, the predictive variance
+        """
+        S, Xobs, lik_var = get_cov_root(self.model)
+        alpha = self.model.prediction_strategy.mean_cache
+        covar_module = self.model.covar_module
+        
+        mu_pred, var_pred = [], []
+        with torch.no_grad():
+            for X_block in torch.split(X_cand, self.predictor.block_size(X_cand)):
+                K_xo = covar_module.forward(X_block, Xobs)
+                mu_pred.append(self.model.mean_module(X_block) + K_xo @ alpha)
+                var_pred.append(covar_module.forward(X_block, X_block, diag=True) - (K_xo @ S).pow(2).sum(-1) + lik_var)
+        var_pred = torch.cat(var_pred).clamp(min=torch.finfo(X_cand.dtype).tiny)
+        return torch.cat(mu_pred), var_pred
     
     def lfi(self, X_cand, log=False):
         """
@@ -28,14 +135,22 @@ class PI:
         Return:
         - lfi: torch.tensor, the LFI values at X_cand
         """
-        mu_pred, var_pred = predict(X_cand, self.model)
-        lfi = D.Normal(0,1).cdf(
+        if self.fused:
+            try:
+                mu_pred, var_pred = self.posterior_fused(X_cand)
+            except (AttributeError, RuntimeError) as error:
+                # the prediction strategy or its caches are unavailable, e.g. the Cholesky factorisation failed
+                warnings.warn(f"the fused LFI failed ({error}), falling back to the gpytorch prediction for this model")
+                self.fused = False
+        if not self.fused:
+            mu_pred, var_pred = self.predictor(X_cand)
+        log_lfi = torch.special.log_ndtr(
             (mu_pred - self.eta) / var_pred.sqrt()
         )
         if log:
-            return (lfi + torch.finfo().eps).log()
+            return log_lfi
         else:
-            return lfi
+            return log_lfi.exp()
     
     def __call__(self, X_cand, log=False):
         """
@@ -49,22 +164,64 @@ class PI:
         - pi: torch.tensor, the pi values at X_cand
         """
         if self.label == "ts":
-            raise NotImplementedError("Not implemented yet")
+            return self.ts(X_cand, log=log)
         elif self.label == "lfi":
             return self.lfi(X_cand, log=log)
         else:
             raise ValueError("Label should be either 'ts' or 'lfi'.")
             
-class PI_FBGP:
-    def __init__(self, model):
+class PI_FBGP(ThompsonSampling):
+    def __init__(self, model, label="lfi", n_samples=64, n_features=1024):
         """
         Definition of pi (feasible resion) for fully Bayesian GP.
+        For TS, the sample paths are drawn for each distilled hypersample, and weighted by its quadrature weight.
         
         Args:
         - model: gpytorch.models, function of GP model
         - label: string, "ts" or "lfi"
+        - n_samples: int, the total number of sample paths for TS
+        - n_features: int, the number of random Fourier features of the sample paths for TS
         """
         self.model = model
+        self.label = label
+        if label == "ts":
+            self.set_ts(n_samples, n_features)
+    
+    def set_ts(self, n_samples, n_features):
+        """
+        Draw the sample paths of f = eta - g^2 / 2 for each hypersample (eta, noise, lengthscale, outputscale),
+        where g is the warped GP conditioned on the pseudo observations, as in FullyBayesianGP.fitbo_predict.
+        
+        Args:
+        - n_samples: int, the total number of sample paths
+        - n_features: int, the number of random Fourier features of the sample paths
+        """
+        n_hypers = len(self.model.Theta_qd)
+        n_per_hyper = max(1, n_samples // n_hypers)
+        self.samplers = []
+        for Theta in self.model.Theta_qd:
+            gobs_pseudo = Theta[0].sign() * (2*(Theta[0] - self.model.fobs)).sqrt()
+            gp = self.model.reset_GP(self.model.Xobs, gobs_pseudo, Theta[1:])
+            self.samplers.append(
+                (Theta[0], DecoupledSampler(gp, n_samples=n_per_hyper, n_features=n_features))
+            )
+        
+        Xobs = self.model.Xobs
+        weights = (self.model.w_qd / self.model.w_qd.sum()).to(Xobs).repeat_interleave(n_per_hyper) / n_per_hyper
+        lengthscales = self.model.Theta_qd[:, 2].to(Xobs).repeat_interleave(n_per_hyper).unsqueeze(1)
+        self.ts_density = ThompsonDensity(self.paths, weights, lengthscales, Xobs)
+    
+    def paths(self, X_cand):
+        """
+        Evaluate the sample paths of all the hypersamples
+        
+        Args:
+        - X_cand: torch.tensor, inputs. torch.Size(n_data, n_dims)
+        
+        Return:
+        - f: torch.tensor, the values of the sample paths. torch.Size(n_paths, n_data)
+        """
+        return torch.cat([eta - 0.5 * sampler(X_cand).pow(2) for eta, sampler in self.samplers])
     
     def lfi(self, X_cand, log=False):
         """
@@ -100,14 +257,14 @@ class PI_FBGP:
         - pi: torch.tensor, the pi values at X_cand
         """
         if self.label == "ts":
-            raise NotImplementedError("Not implemented yet")
+            return self.ts(X_cand, log=log)
         elif self.label == "lfi":
             return self.lfi(X_cand, log=log)
         else:
             raise ValueError("Label should be either 'ts' or 'lfi'.")
 
-class PI_BQ:
-    def __init__(self, model):
+class PI_BQ(ThompsonSampling):
+    def __init__(self, model, label="lfi", n_samples=64, n_features=1024):
         """
         Definition of pi (feasible resion) for Bayesian Quadrature GP model.
         For BQ modelling, see https://arxiv.org/abs/2210.17299
@@ -115,8 +272,21 @@ class PI_BQ:
         Args:
         - model: gpytorch.models, function of GP model
         - label: string, "ts" or "lfi"
+        - n_samples: int, the number of sample paths for TS
+        - n_features: int, the number of random Fourier features of the sample paths for TS
         """
         self.model = model
+        self.label = label
+        if label == "ts":
+            # the maximisers in h space are those in g space, as exp(h) - 1 is monotonic
+            self.sampler = DecoupledSampler(model.model, n_samples=n_samples, n_features=n_features)
+            Xobs = model.model.train_inputs[0]
+            self.ts_density = ThompsonDensity(
+                self.sampler,
+                torch.full((n_samples,), 1 / n_samples, dtype=Xobs.dtype, device=Xobs.device),
+                model.model.covar_module.base_kernel.lengthscale.detach().view(1, -1),
+                Xobs,
+            )
     
     def lfi(self, X_cand, log=False):
         """
@@ -150,7 +320,7 @@ class PI_BQ:
         - pi: torch.tensor, the pi values at X_cand
         """
         if self.label == "ts":
-            raise NotImplementedError("Not implemented yet")
+            return self.ts(X_cand, log=log)
         elif self.label == "lfi":
             return self.lfi(X_cand, log=log)
         else:
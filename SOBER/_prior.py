@@ -1,10 +1,11 @@
 import copy
 import torch
 import torch.distributions as D
+from torch.nn.utils.rnn import pad_sequence
 from abc import ABC, abstractmethod
 import numpy as np
 import pandas as pd
-from ._utils import TensorManager
+from ._utils import TensorManager, QMCStream
 from ._tmvn import TruncatedMVN
 from .mvnorm import multivariate_normal_cdf as Phi
 
@@ -24,17 +25,23 @@ class BasePrior(ABC, TensorManager):
         pass
 
 class Uniform(BasePrior):
-    def __init__(self, bounds):
+    def __init__(self, bounds, seed=None):
         """
         Uniform prior class
         
         Args:
         - bounds: torch.tensor, the lower and upper bounds for each dimension
+        - seed: int, the seed of the scrambled Sobol sequence. Random if None.
         """
         super().__init__() # call TensorManager
         self.bounds = self.standardise_tensor(bounds)
         self.n_dims = self.bounds.shape[1]
         self.type = "continuous"
+        self.centre = (self.bounds[1] + self.bounds[0]) / 2
+        self.half_width = (self.bounds[1] - self.bounds[0]) / 2
+        self.density = (1/(self.bounds[1] - self.bounds[0])).prod()
+        self.log_density = self.density.log()
+        self.qmc_stream = QMCStream(self.n_dims, seed=seed)
         
     def sample(self, n_samples, qmc=True):
         """
@@ -42,17 +49,40 @@ class Uniform(BasePrior):
         
         Args:
         - n_samples: int, the number of initial samples
-        - qmc: bool, sampling from Sobol sequence if True, otherwise simply Monte Carlo sampling.
+        - qmc: bool, sampling from the persistent Sobol sequence if True, otherwise simply Monte Carlo sampling.
         
         Return:
         - samples: torch.tensor, the samples from uniform prior
         """
-        random_samples = self.rand(self.n_dims, n_samples, qmc=qmc)
-        samples = self.bounds[0].unsqueeze(0) + (
-            self.bounds[1] - self.bounds[0]
-        ).unsqueeze(0) * random_samples
+        if qmc:
+            random_samples = self.qmc_stream.draw(n_samples)
+        else:
+            random_samples = self.rand(self.n_dims, n_samples, qmc=False)
+        samples = random_samples.mul_(2 * self.half_width).add_(self.bounds[0])
         return samples
     
+    def rescramble(self, seed=None):
+        """
+        Restart the Sobol sequence of sample with a new scrambling
+        
+        Args:
+        - seed: int, the seed of scrambling. Random if None.
+        """
+        self.qmc_stream.rescramble(seed=seed)
+    
+    def inside(self, samples):
+        """
+        Check whether or not the samples are strictly inside the bounds, with a single temporary tensor
+        
+        Args:
+        - samples: torch.tensor, the input where to check
+        
+        Return:
+        - inside: torch.tensor, 1 if inside the bounds, otherwise 0
+        """
+        distance = (samples - self.centre).abs_().div_(self.half_width).amax(dim=1)
+        return distance.lt(1).to(self.dtype)
+    
     def pdf(self, samples):
         """
         The probability density function (PDF) over samples
@@ -63,16 +93,12 @@ class Uniform(BasePrior):
         Return:
         - pdfs: torch.tensor, the PDF over samples
         """
-        _pdf = self.ones(len(samples)) * (1/(self.bounds[1] - self.bounds[0])).prod()
-        _ood = torch.logical_or(
-            (samples >= self.bounds[1]).any(axis=1), 
-            (samples <= self.bounds[0]).any(axis=1),
-        ).logical_not()
-        return self.standardise_tensor(_pdf * _ood)
+        return self.inside(samples).mul_(self.density)
     
     def logpdf(self, samples):
         """
-        The log probability density function (PDF) over samples
+        The log probability density function (PDF) over samples.
+        Note that it returns 0 outside the bounds.
         
         Args:
         - samples: torch.tensor, the input where to compute PDF
@@ -80,12 +106,7 @@ class Uniform(BasePrior):
         Return:
         - pdfs: torch.tensor, the log PDF over samples
         """
-        _logpdf = self.ones(len(samples)) * (1/(self.bounds[1] - self.bounds[0])).prod().log()
-        _ood = torch.logical_or(
-            (samples >= self.bounds[1]).any(axis=1), 
-            (samples <= self.bounds[0]).any(axis=1),
-        ).logical_not()
-        return self.standardise_tensor(_logpdf * _ood)
+        return self.inside(samples).mul_(self.log_density)
     
 class Gaussian(BasePrior):
     def __init__(self, mu, cov):
@@ -207,14 +228,21 @@ class CategoricalPrior(BasePrior):
         self.n_categories = self.tensor(
             [len(category) for category in self.categories]
         ).long()
+        self.dim_index = self.arange(self.n_dims)
+        self.values = pad_sequence(self.categories, batch_first=True)
         self.weights = [self.ones(n_category) * 0.5 for n_category in self.n_categories]
         self.initialise()
         
     def initialise(self):
         """
-        Reset the weights of the categorical distribution classes
+        Reset the padded probability table from the weights of each dimension.
+        The padded entries beyond the number of categories have zero probability.
         """
-        self.cats = [D.Categorical(weight) for weight in self.weights]
+        self.probs = pad_sequence(
+            [weight / weight.sum() for weight in self.weights], batch_first=True,
+        )
+        self.log_probs = self.probs.log()
+        self.cdf = self.probs.cumsum(1)
     
     def find_corresponding_categories(self, indices):
         """
@@ -226,15 +254,11 @@ class CategoricalPrior(BasePrior):
         Return:
         - samples: torch.tensor, categories correspinding to the given indices
         """
-        indexing_tensor = self.arange(indices.size(1))
-        samples = torch.stack([
-            self.categories[dim][indices[:, dim]] for dim in indexing_tensor
-        ], dim=1)
-        return samples
+        return self.values[self.dim_index, indices.long()]
     
     def sample_both(self, n_samples):
         """
-        Sampling both categorical values and indices from categorical prior
+        Sampling both categorical values and indices from categorical prior via inverse CDF
         
         Args:
         - n_samples: int, the number of samples
@@ -243,7 +267,10 @@ class CategoricalPrior(BasePrior):
         - samples: torch.tensor, random samples from categorical distribution
         - indices: torch.tensor, indices of random samples
         """
-        indices = torch.vstack([cat.sample(torch.Size([n_samples])) for cat in self.cats]).T
+        cdf = self.cdf.detach()
+        u = self.standardise_tensor(torch.rand(self.n_dims, n_samples)) * cdf[:, -1:]
+        indices = torch.searchsorted(cdf, u, right=True)
+        indices = torch.minimum(indices, self.n_categories.unsqueeze(1) - 1).T
         samples = self.find_corresponding_categories(indices)
         return self.standardise_device(samples), indices
     
@@ -265,14 +292,12 @@ class CategoricalPrior(BasePrior):
         The log probability mass function (PMF) over x
         
         Args:
-        - x: torch.tensor, the input where to compute PDF
+        - x: torch.tensor, the indices where to compute PDF
         
         Return:
         - pmfs: torch.tensor, the PMF over x
         """
-        return torch.vstack([
-            self.cats[dim].log_prob(x[:,dim]) for dim in range(self.n_dims)
-        ]).sum(axis=0)
+        return self.log_probs[self.dim_index, x.long()].sum(axis=1)
     
     def pdf(self, x):
         """
@@ -536,12 +561,28 @@ class MixedCategoricalPrior(BasePrior):
         pdf_cont = self.prior_cont.pdf(x_cont)
         pdf_disc = self.prior_disc.pdf(x_disc)
         return pdf_cont * pdf_disc
+    
+    def logpdf(self, x):
+        """
+        The log probability density function (PDF) over x
+        
+        Args:
+        - x: torch.tensor, the input where to compute PDF
+        
+        Return:
+        - pdfs: torch.tensor, the log PDF over samples
+        """
+        x_cont, x_disc = self.separate_samples(x)
+        pdf_cont = self.prior_cont.logpdf(x_cont)
+        pdf_disc = self.prior_disc.logpdf(x_disc)
+        return pdf_cont + pdf_disc
 
 class DatasetPrior(BasePrior):
     def __init__(
         self,
         features,
         true_targets,
+        backend="masked",
     ):
         """
         Dataset prior for which all list of possible candidates are given as dataset
@@ -549,12 +590,19 @@ class DatasetPrior(BasePrior):
         Args:
         - features: torch.tensor, the binary inputs
         - true_targets: torch.tensor, the objective to maximize
+        - backend: string, the bookkeeping of the queried candidates. Select from ["masked", "copy"]
+                   "masked" keeps the features immutable and tracks availability with a boolean mask,
+                   so the indices refer to the original dataset and stay stable across iterations.
+                   "copy" re-slices the features after each query, so the indices refer to the remaining candidates.
         """
         super().__init__() # call TensorManager
-        self.available_index = self.arange(len(features))
+        if not backend in ["masked", "copy"]:
+            raise ValueError("backend should be either 'masked' or 'copy'.")
+        self.backend = backend
         self.features = self.standardise_tensor(features)
         self.true_targets = self.standardise_tensor(true_targets)
-        self.reset_indices(self.available_index)
+        self.mask = self.ones(len(self.features)).to(torch.bool)
+        self.reset_indices(self.arange(len(self.features)))
         self.type = "dataset"
         
     def reset_indices(self, available_index):
@@ -565,9 +613,12 @@ class DatasetPrior(BasePrior):
         - available_index: torch.tensor, the available indices that the queried indices are removed.
         """
         self.n_available = available_index.shape[0]
-        self.features = self.features[available_index]
-        self.true_targets = self.true_targets[available_index]
-        self.available_index = self.arange(self.n_available)
+        if self.backend == "masked":
+            self.available_index = available_index
+        else:
+            self.features = self.features[available_index]
+            self.true_targets = self.true_targets[available_index]
+            self.available_index = self.arange(self.n_available)
         
     def set_substract(self, A, B):
         """
@@ -591,9 +642,25 @@ class DatasetPrior(BasePrior):
         Args:
         - idx_sampled: torch.tensor, the sampled indices from the available indices.
         """
-        available_index = self.set_substract(self.available_index, idx_sampled)
+        if self.backend == "masked":
+            self.mask[idx_sampled] = False
+            available_index = self.mask.nonzero().squeeze(-1)
+        else:
+            available_index = self.set_substract(self.available_index, idx_sampled)
         self.reset_indices(available_index)
     
+    def global_index(self, positions):
+        """
+        Map the positions within the available candidates to the dataset indices used by query
+        
+        Args:
+        - positions: torch.tensor, the positions within available_candidates()
+        
+        Return:
+        - indices: torch.tensor, the dataset indices
+        """
+        return self.available_index[positions]
+    
     def query(self, idx_cand):
         """
         Query Y at given indices.
@@ -621,7 +688,7 @@ class DatasetPrior(BasePrior):
         - X: torch.tensor, the features.
         - Y: torch.tensor, the true values.
         """
-        idx_sampled = self.randperm(self.n_available)[:n_sample]
+        idx_sampled = self.global_index(self.randperm(self.n_available)[:n_sample])
         X = self.features[idx_sampled]
         Y = self.true_targets[idx_sampled]
         self.remove_sampled_index(idx_sampled)
@@ -637,18 +704,38 @@ class DatasetPrior(BasePrior):
         Return:
         - X: torch.tensor, the features.
         """
-        idx_sampled = self.randperm(self.n_available)[:n_sample]
+        idx_sampled = self.global_index(self.randperm(self.n_available)[:n_sample])
         X = self.features[idx_sampled]
         return idx_sampled, X
     
     def available_candidates(self):
         """
-        Sample all available X
+        Sample all available X.
+        The features are returned without copying as long as no candidate has been removed.
         
         Return:
         - X: torch.tensor, the features.
         """
-        return self.features
+        if self.n_available == len(self.features):
+            return self.features
+        return self.features[self.available_index]
+    
+    def iterate_candidates(self, chunk_size=100000):
+        """
+        Iterate over all available X chunk by chunk.
+        Each chunk is a view while no candidate has been removed, otherwise a gathered copy of the chunk only.
+        
+        Args:
+        - chunk_size: int, the number of candidates per chunk
+        
+        Return:
+        - generator, yielding the features of each chunk
+        """
+        for start in range(0, self.n_available, chunk_size):
+            if self.n_available == len(self.features):
+                yield self.features[start:start + chunk_size]
+            else:
+                yield self.features[self.available_index[start:start + chunk_size]]
     
     def pdf(self, X):
         return self.ones(len(X)) / len(X)
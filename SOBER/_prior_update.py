@@ -226,9 +226,113 @@ class CategoricalMLE(BaseMLE):
         """
         weights_updated = self.run()
         prior_disc.weights = self.reshape_weights(weights_updated)
+        prior_disc.initialise()
         return prior_disc
     
-def update_binary_prior(weights, x_binary, prior_binary):
+def weighted_marginals(weights, x_index, n_categories):
+    """
+    Weighted frequency of each category per dimension, computed with a single scatter-add
+    over the flattened (dimension, category) table.
+    
+    Args:
+    - weights: torch.tensor, the weights at the observed input. torch.Size(n_data)
+    - x_index: torch.tensor, the category indices of the observed input. torch.Size(n_data, n_dims)
+    - n_categories: torch.tensor, the number of categories for each dimension. torch.Size(n_dims)
+    
+    Return:
+    - counts: torch.tensor, the flattened weighted counts. torch.Size(n_categories.sum())
+    - sections: torch.tensor, the offsets of each dimension in counts. torch.Size(n_dims + 1)
+    """
+    n_categories = n_categories.long().to(x_index.device)
+    sections = torch.cat([n_categories.new_zeros(1), n_categories.cumsum(0)])
+    flat_index = (x_index.long() + sections[:-1].unsqueeze(0)).reshape(-1)
+    counts = torch.zeros(
+        int(sections[-1]), dtype=weights.dtype, device=weights.device,
+    ).scatter_add_(
+        0, flat_index, weights.unsqueeze(1).expand(x_index.shape).reshape(-1),
+    )
+    return counts, sections
+
+class AnalyticMLE(TensorManager):
+    def __init__(self, weights, x_index, n_categories, smoothing=1e-2, damping=0.7):
+        """
+        Closed-form weighted maximum likelihood estimation (MLE) of independent categorical
+        (and Bernoulli) marginals. The weighted MLE is the normalised weighted frequency,
+        p_mle = (counts + smoothing) / (sum(weights) + smoothing * n_categories),
+        and the update is damped towards the previous probabilities as in the cross-entropy method,
+        p_new = damping * p_mle + (1 - damping) * p_old.
+        
+        Args:
+        - weights: torch.tensor, the weights at the observed input
+        - x_index: torch.tensor, the category indices of the observed input
+        - n_categories: torch.tensor, the number of categories for each dimension
+        - smoothing: float, the pseudo count of Laplace smoothing
+        - damping: float, the step size of the update, from 0 (no update) to 1 (pure MLE)
+        
+        With smoothing = 0 and damping = 1, a category without weight gets probability 0 and is never
+        sampled again, so the defaults keep a small pseudo count relative to the normalised weights
+        and damp the update, so that no probability collapses to 0 or 1.
+        """
+        super().__init__() # call TensorManager
+        self.weights = weights.detach()
+        self.x_index = x_index.detach()
+        self.n_categories = n_categories
+        self.smoothing = smoothing
+        self.damping = damping
+    
+    def run(self, probs_old=None):
+        """
+        Compute the damped and smoothed weighted MLE
+        
+        Args:
+        - probs_old: torch.tensor, the flattened previous probabilities. No damping if None.
+        
+        Return:
+        - probs: torch.tensor, the flattened updated probabilities
+        - sections: torch.tensor, the offsets of each dimension in probs
+        """
+        counts, sections = weighted_marginals(self.weights, self.x_index, self.n_categories)
+        n_categories = sections.diff()
+        counts = counts + self.smoothing
+        totals = torch.zeros(
+            len(n_categories), dtype=counts.dtype, device=counts.device,
+        ).index_add_(0, torch.repeat_interleave(n_categories), counts)
+        probs = counts / totals.clamp(min=torch.finfo(counts.dtype).tiny).repeat_interleave(n_categories)
+        if probs_old is not None and self.damping < 1:
+            probs = self.damping * probs + (1 - self.damping) * probs_old
+        return probs, sections
+    
+    def update_binary(self, prior_binary):
+        """
+        Update the Bernoulli prior
+        
+        Args:
+        - prior_binary: torch.distributions.Bernoulli, the Bernoulli prior
+        
+        Return:
+        - prior_binary: torch.distributions.Bernoulli, the updated Bernoulli prior
+        """
+        probs_old = torch.stack([1 - prior_binary.probs, prior_binary.probs], dim=1).reshape(-1)
+        probs, _ = self.run(probs_old)
+        return D.Bernoulli(probs.view(-1, 2)[:, 1])
+    
+    def update_categorical(self, prior_disc):
+        """
+        Update the categorical prior
+        
+        Args:
+        - prior_disc: class, the categorical prior
+        
+        Return:
+        - prior_disc: class, the updated categorical prior
+        """
+        probs_old = torch.cat([weight / weight.sum() for weight in prior_disc.weights])
+        probs, sections = self.run(probs_old)
+        prior_disc.weights = list(torch.split(probs, sections.diff().tolist()))
+        prior_disc.initialise()
+        return prior_disc
+    
+def update_binary_prior(weights, x_binary, prior_binary, mle_method="lbfgs", smoothing=1e-2, damping=0.7):
     """
     Update the Bernoulli prior
 
@@ -236,15 +340,25 @@ def update_binary_prior(weights, x_binary, prior_binary):
     - weights: torch.tensor, the weghts at X_cand
     - X_binary: torch.tensor, the binary input
     - prior_binary: torch.distributions.Bernoulli, the Bernoulli prior
+    - mle_method: string, the MLE engine. Select from ["analytic", "lbfgs"]
+    - smoothing: float, the pseudo count of Laplace smoothing, only for "analytic"
+    - damping: float, the damping factor of the update, only for "analytic"
 
     Return:
     - prior_binary: torch.distributions.Bernoulli, the Bernoulli prior
     """
-    mle_binary = BernoulliMLE(weights, x_binary)
-    prior_binary = mle_binary.update_prior(prior_binary)
+    if mle_method == "analytic":
+        n_categories = torch.full((x_binary.size(1),), 2, device=x_binary.device)
+        mle_binary = AnalyticMLE(weights, x_binary, n_categories, smoothing=smoothing, damping=damping)
+        prior_binary = mle_binary.update_binary(prior_binary)
+    elif mle_method == "lbfgs":
+        mle_binary = BernoulliMLE(weights, x_binary)
+        prior_binary = mle_binary.update_prior(prior_binary)
+    else:
+        raise ValueError("mle_method should be either 'analytic' or 'lbfgs'.")
     return prior_binary
 
-def update_categorical_prior(weights, x_disc, prior_categorical):
+def update_categorical_prior(weights, x_disc, prior_categorical, mle_method="lbfgs", smoothing=1e-2, damping=0.7):
     """
     Update the categorical prior
 
@@ -252,15 +366,26 @@ def update_categorical_prior(weights, x_disc, prior_categorical):
     - weights: torch.tensor, the weghts at X_cand
     - X_disc: torch.tensor, the categorical input
     - prior_categorical: torch.distributions.Categorical, the Categorical prior
+    - mle_method: string, the MLE engine. Select from ["analytic", "lbfgs"]
+    - smoothing: float, the pseudo count of Laplace smoothing, only for "analytic"
+    - damping: float, the damping factor of the update, only for "analytic"
 
     Return:
     - prior_categorical: torch.distributions.Categorical, the optimised Categorical prior
     """
-    mle_disc = CategoricalMLE(weights, x_disc, prior_categorical)
-    prior_categorical =  mle_disc.update_prior(prior_categorical)
+    if mle_method == "analytic":
+        mle_disc = AnalyticMLE(
+            weights, x_disc, prior_categorical.n_categories, smoothing=smoothing, damping=damping,
+        )
+        prior_categorical = mle_disc.update_categorical(prior_categorical)
+    elif mle_method == "lbfgs":
+        mle_disc = CategoricalMLE(weights, x_disc, prior_categorical)
+        prior_categorical =  mle_disc.update_prior(prior_categorical)
+    else:
+        raise ValueError("mle_method should be either 'analytic' or 'lbfgs'.")
     return prior_categorical
 
-def update_continuous_prior(X_cand, weights, prior, n_dims):
+def update_continuous_prior(X_cand, weights, prior, n_dims, pdf_method="whitened", rtol=1e-2):
     """
     Update the continuous prior
 
@@ -269,6 +394,8 @@ def update_continuous_prior(X_cand, weights, prior, n_dims):
     - weights: torch.tensor, the weghts at X_cand
     - prior: class, the continuous prior
     - n_dims: int, the number of dimensions
+    - pdf_method: string, the PDF engine of WKDE, select from ["whitened", "tree", "mvn"]
+    - rtol: float, the relative error tolerance of the PDF for the "tree" engine
 
     Return:
     - prior: class, the Gaussian mixture prior
@@ -279,11 +406,11 @@ def update_continuous_prior(X_cand, weights, prior, n_dims):
         bounds = None
         
     prior = WeightedKernelDensityEstimation(
-        X_cand, weights, n_dims, bounds=bounds,
+        X_cand, weights, n_dims, bounds=bounds, pdf_method=pdf_method, rtol=rtol,
     )
     return prior
 
-def update_mixed_prior(X_cand, weights, prior, label="binary"):
+def update_mixed_prior(X_cand, weights, prior, label="binary", mle_method="lbfgs", smoothing=1e-2, damping=0.7):
     """
     Update the mixed prior
 
@@ -292,6 +419,9 @@ def update_mixed_prior(X_cand, weights, prior, label="binary"):
     - weights: torch.tensor, the weghts at X_cand
     - prior: class, the mixed prior
     - label: string, "binary" or "categorical"
+    - mle_method: string, the MLE engine of the discrete prior. Select from ["analytic", "lbfgs"]
+    - smoothing: float, the pseudo count of Laplace smoothing, only for "analytic"
+    - damping: float, the damping factor of the update, only for "analytic"
 
     Return:
     - prior: class, the mixed prior
@@ -300,10 +430,12 @@ def update_mixed_prior(X_cand, weights, prior, label="binary"):
     if label == "binary":
         prior.prior_binary.prior_binary = update_binary_prior(
             weights, x_disc, prior.prior_binary.prior_binary,
+            mle_method=mle_method, smoothing=smoothing, damping=damping,
         )
     elif label == "categorical":
         prior.prior_disc = update_categorical_prior(
             weights, x_disc, prior.prior_disc,
+            mle_method=mle_method, smoothing=smoothing, damping=damping,
         )
     else:
         raise ValueError("label should be either 'binary' or 'categorical'.")
@@ -1,7 +1,10 @@
+import os
 import time
 import torch
+import warnings
 from ._utils import SafeTensorOperator
 tm = SafeTensorOperator()
+_worker_state = {}
 
 def recombination(
     pts_rec,         # random samples for recombination
@@ -12,6 +15,11 @@ def recombination(
     dtype,           # dtype
     init_weights=None,  # initial weights of the sample for recombination
     calc_obj=None,   # a function for calculating an additional objective function
+    precompute_features=False,  # compute the Nyström features only once
+    block_size=10000,  # the number of columns computed at once for the Nyström features
+    car_engine="standard",  # the reduction engine from N points to n+1
+    backend="serial",  # "serial" or "process"
+    n_workers=None,  # the number of worker processes for the "process" backend
 ):
     """
     Args:
@@ -23,12 +31,288 @@ def recombination(
         - dtype: torch.dtype, torch.float or torch.double
         - init_weights: torch.tensor, weights for importance sampling if pts_rec is not sampled from the prior
         - calc_obj: a function that returns a Tensor of objective values for all the input points
+        - precompute_features: bool, compute the Nyström features U_svd @ K(pts_nys, pts_rec) once if true,
+                               otherwise the kernel is re-evaluated at every level of the merge-reduce loop.
+        - block_size: int, the number of columns of the Nyström features computed at once
+        - car_engine: string, the reduction engine, select from ["standard", "vectorised"]
+        - backend: string, "serial" runs on a single process, "process" runs divide-and-conquer recombination
+                   over a process pool, see recombination_parallel.
+        - n_workers: int, the number of worker processes. If None, all the CPU cores are used.
+
+    If the kernel has finite-dimensional features (Kernel with mode "rff"), pts_nys is not used and
+    the reduction runs on the principal components of the features, see rc_kernel_features.
+    The "process" backend is not supported in that case, and the serial backend is used instead.
 
     Returns:
         - x: torch.tensor, the sparcified samples from pts_rec. The number of samples are determined by self.batch_size
         - w: torch.tensor, the positive weights for kernel quadrature as discretised summation.
     """
-    return rc_kernel_svd(pts_rec, pts_nys, num_pts, kernel, tm, mu=init_weights, calc_obj=calc_obj)
+    if getattr(kernel, "mode", None) == "rff":
+        return rc_kernel_features(
+            pts_rec, num_pts, kernel, tm, mu=init_weights, calc_obj=calc_obj, block_size=block_size,
+            car_engine=car_engine,
+        )
+
+    if backend == "serial":
+        return rc_kernel_svd(
+            pts_rec, pts_nys, num_pts, kernel, tm, mu=init_weights, calc_obj=calc_obj,
+            precompute_features=precompute_features, block_size=block_size, car_engine=car_engine,
+        )
+    elif backend == "process":
+        return recombination_parallel(
+            pts_rec, pts_nys, num_pts, kernel, device, dtype, init_weights=init_weights, calc_obj=calc_obj,
+            precompute_features=precompute_features, block_size=block_size, car_engine=car_engine,
+            n_workers=n_workers,
+        )
+    else:
+        raise ValueError('backend should be from ["serial", "process"]')
+
+
+def _initialise_recombination_worker(samp, mu, U_svd, pt_nys, kernel, n_threads, options):
+    """
+    Receive the shared candidates and Nyström basis once per worker process.
+    """
+    torch.set_num_threads(n_threads)
+    _worker_state.update(
+        samp=samp, mu=mu, U_svd=U_svd, pt_nys=pt_nys, kernel=kernel, options=options,
+    )
+
+
+def _reduce_partition(idx):
+    """
+    Reduce a disjoint partition of the candidates to n+1 points within a worker process.
+
+    Args:
+        - idx: torch.tensor, the indices of the partition
+
+    Returns:
+        - idx: torch.tensor, the indices of the reduced points
+        - w: torch.tensor, the weights of the reduced points
+    """
+    state = _worker_state
+    w_star, idx_star = Mod_Tchernychova_Lyons(
+        state["samp"][idx], state["U_svd"], state["pt_nys"], state["kernel"], tm,
+        mu=state["mu"][idx].clone(), **state["options"],
+    )
+    return idx[idx_star], w_star
+
+
+def recombination_parallel(
+    pts_rec,         # random samples for recombination
+    pts_nys,         # number of samples used for approximating kernel with Nystrom method
+    num_pts,         # number of samples finally returned
+    kernel,          # kernel
+    device,          # device
+    dtype,           # dtype
+    init_weights=None,  # initial weights of the sample for recombination
+    calc_obj=None,   # a function for calculating an additional objective function
+    precompute_features=False,  # compute the Nyström features only once
+    block_size=10000,  # the number of columns computed at once for the Nyström features
+    car_engine="standard",  # the reduction engine from N points to n+1
+    n_workers=None,  # the number of worker processes
+    start_method="spawn",  # the start method of multiprocessing
+):
+    """
+    Divide-and-conquer kernel recombination over a process pool.
+    The candidates are split into disjoint partitions, each reduced to n+1 points by a worker process,
+    then the survivors are merged and reduced once more in the main process.
+    The candidates and the Nyström basis are copied once to shared memory and passed to each worker only once,
+    so the caller's tensors are left untouched.
+
+    Args:
+        - n_workers: int, the number of worker processes. If None, all the CPU cores are used.
+        - start_method: string, the start method of multiprocessing. "spawn" by default, because forking
+                        after torch and OpenMP have started their thread pools can deadlock the workers.
+                        With "spawn", the kernel must be picklable and the calling script should be guarded
+                        by `if __name__ == "__main__":`.
+        - others: see recombination
+
+    Returns:
+        - idx: torch.tensor, the indices of the selected samples
+        - w: torch.tensor, the positive weights for kernel quadrature as discretised summation.
+    """
+    N = len(pts_rec)
+    mu = tm.ones(N) / N if init_weights is None else init_weights
+    idx_positive = tm.arange(N)[mu > 0]
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    # each partition should hold at least two sets of n+1 points to be worth reducing
+    n_workers = min(n_workers, len(idx_positive) // (2 * num_pts))
+    options = dict(precompute_features=precompute_features, block_size=block_size, car_engine=car_engine)
+    if tm.is_cuda() or n_workers < 2:
+        if tm.is_cuda():
+            warnings.warn("The process backend supports CPU only. Running on a single process instead.")
+        return rc_kernel_svd(
+            pts_rec, pts_nys, num_pts, kernel, tm, mu=mu, calc_obj=calc_obj, **options,
+        )
+
+    _, U = ker_svd_sparsify(pts_nys, num_pts - 1, kernel)
+    partitions = torch.tensor_split(idx_positive, n_workers)
+
+    shared = [tensor.detach().clone().share_memory_() for tensor in [pts_rec, mu, U, pts_nys]]
+    n_threads = max(1, torch.get_num_threads() // n_workers)
+    context = torch.multiprocessing.get_context(start_method)
+    with context.Pool(
+        n_workers,
+        initializer=_initialise_recombination_worker,
+        initargs=(*shared, kernel, n_threads, options),
+    ) as pool:
+        survivors = pool.map(_reduce_partition, partitions)
+
+    idx_merged = torch.cat([idx for idx, _ in survivors])
+    w_merged = torch.cat([w for _, w in survivors])
+    w_star, idx_star = Mod_Tchernychova_Lyons(
+        pts_rec[idx_merged], U, pts_nys, kernel, tm, mu=w_merged, calc_obj=calc_obj, **options,
+    )
+    return idx_merged[idx_star], w_star
+
+
+def recombination_streaming(
+    chunks,          # iterator of (random samples, weights) for recombination
+    pts_nys,         # number of samples used for approximating kernel with Nystrom method
+    num_pts,         # number of samples finally returned
+    kernel,          # kernel
+    device,          # device
+    dtype,           # dtype
+    calc_obj=None,   # a function for calculating an additional objective function
+    precompute_features=False,  # compute the Nyström features only once per chunk
+    block_size=10000,  # the number of columns computed at once for the Nyström features
+    car_engine="standard",  # the reduction engine from N points to n+1
+    return_samples=False,  # return the selected samples as well
+):
+    """
+    Out-of-core kernel recombination over a stream of candidate chunks.
+    Each chunk is reduced to at most num_pts points preserving its weighted barycentre as it arrives,
+    and the survivors are merged hierarchically (two sets of the same level are merged and reduced again).
+    The peak memory thus depends on the chunk size, not on the total number of candidates.
+
+    Args:
+        - chunks: iterator, yielding (samples, weights) pairs. The weights are not normalised across chunks.
+        - pts_nys: torch.tensor, subsamples for low-rank approximation via Nyström method
+        - num_pts: int, number of samples finally returned. In BASQ context, this is equivalent to batch size
+        - kernel: function of covariance_matrix = function(X, Y). Positive semi-definite Gram matrix (a.k.a. kernel)
+        - device: torch.device, cpu or cuda
+        - dtype: torch.dtype, torch.float or torch.double
+        - calc_obj: a function that returns a Tensor of objective values for all the input points.
+                    This is applied only at the final reduction.
+        - precompute_features: bool, compute the Nyström features once per reduction if true, otherwise not.
+        - block_size: int, the number of columns of the Nyström features computed at once
+        - car_engine: string, the reduction engine, select from ["standard", "vectorised"]
+        - return_samples: bool, return the selected samples if true, otherwise not.
+
+    Returns:
+        - idx: torch.tensor, the global indices of the selected samples over the concatenated stream
+        - w: torch.tensor, the positive weights for kernel quadrature, normalised to sum to one.
+        - x: (optional) torch.tensor, the selected samples
+    """
+    _, U = ker_svd_sparsify(pts_nys, num_pts - 1, kernel)
+
+    def reduce(samp, mu, idx_global, calc_obj=None):
+        w_star, idx_star = Mod_Tchernychova_Lyons(
+            samp, U, pts_nys, kernel, tm, mu=mu, calc_obj=calc_obj,
+            precompute_features=precompute_features, block_size=block_size, car_engine=car_engine,
+        )
+        return idx_global[idx_star], samp[idx_star], w_star
+
+    levels = []
+    offset = 0
+    for X_chunk, w_chunk in chunks:
+        n_chunk = len(X_chunk)
+        idx_global = tm.arange(n_chunk) + offset
+        offset += n_chunk
+        survivors = reduce(X_chunk, tm.standardise_tensor(w_chunk).clone(), idx_global)
+
+        # merge-reduce the survivors of the same level
+        level = 0
+        while len(levels) > 0 and levels[-1][0] == level:
+            _, survivors_prev = levels.pop()
+            idx_global, X_merged, w_merged = [
+                torch.cat([prev, new]) for prev, new in zip(survivors_prev, survivors)
+            ]
+            survivors = reduce(X_merged, w_merged, idx_global)
+            level += 1
+        levels.append((level, survivors))
+
+    if len(levels) == 0:
+        raise ValueError("The given stream of candidates is empty.")
+
+    idx_global, X_merged, w_merged = [
+        torch.cat(survivors) for survivors in zip(*[survivors for _, survivors in levels])
+    ]
+    idx, x, w = reduce(X_merged, w_merged, idx_global, calc_obj=calc_obj)
+    w = w / w.sum()
+    if return_samples:
+        return idx, w, x
+    else:
+        return idx, w
+
+
+def kernel_diag(kernel, X, block_size=1000):
+    """
+    Args:
+        - kernel: function of covariance_matrix = function(X, Y)
+        - X: torch.tensor, inputs
+        - block_size: int, the block size for kernels without the diag method
+
+    Returns:
+        - diag: torch.tensor, the diagonal of the Gram matrix K(X, X)
+    """
+    if hasattr(kernel, "diag"):
+        return kernel.diag(X)
+    return torch.cat([torch.diagonal(kernel(x, x)) for x in torch.split(X, block_size)])
+
+
+def pivoted_cholesky_landmarks(X, kernel, max_rank, tol=1e-3, min_rank=1):
+    """
+    Greedy pivoted-Cholesky selection of Nyström landmarks.
+    The point with the largest residual variance is added one by one, until the relative trace residual
+    of the low-rank approximation falls below tol, or max_rank landmarks are selected.
+
+    Args:
+        - X: torch.tensor, the pool of candidate landmarks
+        - kernel: function of covariance_matrix = function(X, Y)
+        - max_rank: int, the maximum number of landmarks
+        - tol: float, the tolerance of the relative trace residual
+        - min_rank: int, the minimum number of landmarks. If the residual is exhausted before reaching min_rank,
+                    the remaining landmarks are drawn at random.
+
+    Returns:
+        - idx: torch.tensor, the indices of the selected landmarks
+        - info: dict, the achieved rank and the relative trace residual
+    """
+    N = len(X)
+    max_rank = min(max_rank, N)
+    min_rank = min(min_rank, max_rank)
+    d = kernel_diag(kernel, X).clone()
+    trace = d.clamp(min=0).sum().clamp(min=torch.finfo(d.dtype).tiny)
+    L = tm.zeros(max_rank, N)
+    idx = tm.arange(max_rank)
+    selected = torch.zeros(N, dtype=torch.bool, device=d.device)
+
+    rank = 0
+    n_pivots = 0
+    while rank < max_rank:
+        residual = d.clamp(min=0).sum() / trace
+        if rank >= min_rank and residual <= tol:
+            break
+        p = torch.argmax(d)
+        if d[p] <= 0:
+            if rank >= min_rank:
+                break
+            p = torch.arange(N, device=d.device)[selected.logical_not()][torch.randint(N - rank, (1,))].squeeze()
+        else:
+            col = kernel(X, X[p].unsqueeze(0)).squeeze(-1)
+            col = (col - L[:n_pivots].T @ L[:n_pivots, p]) / d[p].sqrt()
+            L[n_pivots] = col
+            d -= col.pow(2)
+            n_pivots += 1
+        d[p] = 0.
+        selected[p] = True
+        idx[rank] = p
+        rank += 1
+    residual = d.clamp(min=0).sum() / trace
+    info = {"rank": n_pivots, "residual": residual.item()}
+    return idx[:rank], info
 
 
 def ker_svd_sparsify(pt, s, kernel):
@@ -39,20 +323,108 @@ def ker_svd_sparsify(pt, s, kernel):
     return S, U
 
 
-def rc_kernel_svd(samp, pt, s, kernel, tm, mu=None, calc_obj=None):
+def nystrom_features(samp, U_svd, pt_nys, kernel, tm, idx=None, block_size=10000):
+    """
+    Compute the Nyström features U_svd @ K(pt_nys, samp) in memory-bounded column blocks.
+
+    Args:
+        - samp: torch.tensor, samples for recombination
+        - U_svd: torch.tensor, the eigenvectors of the Nyström approximation
+        - pt_nys: torch.tensor, samples for Nyström approximation
+        - kernel: function of covariance_matrix = function(X, Y)
+        - tm: class, TensorManager
+        - idx: torch.tensor, the indices of samp to compute. Columns not in idx are left zero.
+        - block_size: int, the number of columns computed at once
+
+    Returns:
+        - X_feat: torch.tensor, the Nyström features. torch.Size(n, len(samp))
+    """
+    if idx is None:
+        idx = tm.arange(len(samp))
+    X_feat = tm.zeros(U_svd.size(0), len(samp))
+    for idx_block in torch.split(idx, block_size):
+        X_feat[:, idx_block] = U_svd @ kernel(pt_nys, samp[idx_block])
+    return X_feat
+
+
+def rc_kernel_svd(
+    samp, pt, s, kernel, tm, mu=None, calc_obj=None,
+    precompute_features=False, block_size=10000, car_engine="standard",
+):
     # Nystrom method
     _, U = ker_svd_sparsify(pt, s - 1, kernel)
     w_star, idx_star = Mod_Tchernychova_Lyons(
-        samp, U, pt, kernel, tm, mu=mu, calc_obj=calc_obj
+        samp, U, pt, kernel, tm, mu=mu, calc_obj=calc_obj,
+        precompute_features=precompute_features, block_size=block_size, car_engine=car_engine,
+    )
+    return idx_star, w_star
+
+
+def principal_features(samp, s, kernel, tm, mu, idx, block_size=10000):
+    """
+    Compute the projection of the finite-dimensional kernel features onto the top s-1 principal components
+    of the weighted second moment matrix Psi^T diag(mu) Psi, which approximate the leading eigenfunctions
+    of the kernel integral operator under the empirical measure. This plays the role of the Nyström features.
+
+    Args:
+        - samp: torch.tensor, samples for recombination
+        - s: int, number of samples finally returned
+        - kernel: class, Kernel with the method features(x)
+        - tm: class, TensorManager
+        - mu: torch.tensor, the weights of samp
+        - idx: torch.tensor, the indices of samp to compute. Columns not in idx are left zero.
+        - block_size: int, the number of samples whose features are computed at once
+
+    Returns:
+        - V: torch.tensor, the principal directions. torch.Size(s-1, n_features)
+        - X_feat: torch.tensor, the projected features. torch.Size(s-1, len(samp))
+    """
+    C = 0
+    for idx_block in torch.split(idx, block_size):
+        psi = kernel.features(samp[idx_block])
+        C = C + (psi.T * mu[idx_block]) @ psi
+    _, V = torch.linalg.eigh(C)
+    V = V[:, -(s - 1):].flip(-1).T
+
+    X_feat = tm.zeros(s - 1, len(samp))
+    for idx_block in torch.split(idx, block_size):
+        X_feat[:, idx_block] = V @ kernel.features(samp[idx_block]).T
+    return V, X_feat
+
+
+def rc_kernel_features(
+    samp, s, kernel, tm, mu=None, calc_obj=None, block_size=10000, car_engine="standard",
+):
+    """
+    Kernel recombination with finite-dimensional kernel features, without the Nyström approximation.
+    The cost is linear in the number of samples, as no Gram matrix is evaluated.
+    """
+    N = len(samp)
+    if mu is None:
+        mu = tm.ones(N) / N
+    idx_positive = tm.arange(N)[mu > 0]
+    V, X_feat = principal_features(samp, s, kernel, tm, mu, idx_positive, block_size=block_size)
+
+    w_star, idx_star = Mod_Tchernychova_Lyons(
+        samp, V, None, kernel, tm, mu=mu, calc_obj=calc_obj, car_engine=car_engine, X_feat=X_feat,
     )
     return idx_star, w_star
 
 
-def Mod_Tchernychova_Lyons(samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=None, DEBUG=False):
+def Mod_Tchernychova_Lyons(
+    samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=None, DEBUG=False,
+    precompute_features=False, block_size=10000, car_engine="standard", X_feat=None,
+):
     """
     This function is a modified Tcherynychova_Lyons from
     https://github.com/FraCose/Recombination_Random_Algos/blob/master/recombination.py
+
+    If precompute_features is true, the Nyström features U_svd @ K(pt_nys, samp) are computed once,
+    and each level of the merge-reduce loop only indexes and reweights the precomputed columns.
+    The features can also be given as X_feat, which is then used instead of the kernel.
+    car_engine selects the reduction engine from N points to n+1, see select_car_engine.
     """
+    car = select_car_engine(car_engine)
     N = len(samp)
     n, length = U_svd.shape
     number_of_sets = 2 * (n + 1)
@@ -68,6 +440,17 @@ def Mod_Tchernychova_Lyons(samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=No
     if use_obj:
         obj = -1 * calc_obj(samp)
 
+    if X_feat is not None:
+        precompute_features = True
+    elif precompute_features:
+        X_feat = nystrom_features(samp, U_svd, pt_nys, kernel, tm, idx=idx_story, block_size=block_size)
+
+    def features(idx):
+        if precompute_features:
+            return X_feat[:, idx]
+        else:
+            return U_svd @ kernel(pt_nys, samp[idx])
+
     while True:
         if remaining_points <= n + 1:
             idx_star = tm.arange(len(mu))[mu > 0]
@@ -75,13 +458,13 @@ def Mod_Tchernychova_Lyons(samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=No
             return w_star, idx_star
 
         elif n + 1 < remaining_points <= number_of_sets:
-            X_mat = U_svd @ kernel(pt_nys, samp[idx_story])
+            X_mat = features(idx_story)
             if use_obj:
                 X_mat = torch.cat((X_mat, torch.reshape(
                     obj[idx_story], (1, -1))), 0)
                 X_mat_raw = torch.clone(X_mat[:-1])
             
-            w_star, idx_star, x_star, _, ERR, _, _ = Tchernychova_Lyons_CAR(
+            w_star, idx_star, x_star, _, ERR, _, _ = car(
                 X_mat.T, torch.clone(mu[idx_story]), tm, DEBUG)
 
             if use_obj:
@@ -121,19 +504,27 @@ def Mod_Tchernychova_Lyons(samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=No
         # compute X_for_nys and X_for_obj
         N_approx = number_of_sets * number_of_el
         _idx_tmp = idx_story[:N_approx].reshape(number_of_el, number_of_sets)
-        K = kernel(pt_nys, samp[_idx_tmp]) * mu[_idx_tmp].unsqueeze(1)
-        X_for_nys = tm.zeros(length, number_of_sets)
-        X_for_nys += K.sum(axis=0)
-
         N_rest = len(idx_story) - N_approx
         if N_rest > 0:
             idx_rest = idx_story[N_approx : N_approx + N_rest]
-            K = kernel(pt_nys, samp[idx_rest]) * mu[idx_rest].unsqueeze(0)
-            K_pad = torch.cat(
-                (K, tm.zeros(length, number_of_sets - N_rest)),
-                dim=1,
-            )
-            X_for_nys += K_pad
+
+        if precompute_features:
+            X_tmp_tr = (X_feat[:, _idx_tmp] * mu[_idx_tmp].unsqueeze(0)).sum(axis=1)
+            if N_rest > 0:
+                X_tmp_tr[:, :N_rest] += X_feat[:, idx_rest] * mu[idx_rest].unsqueeze(0)
+        else:
+            K = kernel(pt_nys, samp[_idx_tmp]) * mu[_idx_tmp].unsqueeze(1)
+            X_for_nys = tm.zeros(length, number_of_sets)
+            X_for_nys += K.sum(axis=0)
+
+            if N_rest > 0:
+                K = kernel(pt_nys, samp[idx_rest]) * mu[idx_rest].unsqueeze(0)
+                K_pad = torch.cat(
+                    (K, tm.zeros(length, number_of_sets - N_rest)),
+                    dim=1,
+                )
+                X_for_nys += K_pad
+            X_tmp_tr = U_svd @ X_for_nys
 
         if use_obj:
             X_for_obj = tm.zeros(1, number_of_sets)
@@ -145,7 +536,6 @@ def Mod_Tchernychova_Lyons(samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=No
                 mat_obj_pad = torch.cat((mat_obj, tm.zeros(number_of_sets - N_rest, 1)), dim=0)
                 X_for_obj += mat_obj_pad        
         
-        X_tmp_tr = U_svd @ X_for_nys
         if use_obj:
             X_tmp_tr = torch.cat((X_tmp_tr, X_for_obj), 0)
         X_tmp = X_tmp_tr.T
@@ -153,7 +543,7 @@ def Mod_Tchernychova_Lyons(samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=No
         idx_last_part = idx_story[number_of_el * number_of_sets:]
 
         if len(idx_last_part):
-            X_mat = U_svd @ kernel(pt_nys, samp[idx_last_part])
+            X_mat = features(idx_last_part)
             if use_obj:
                 X_mat = torch.cat((X_mat, torch.reshape(
                     obj[idx_last_part], (1, -1))), 0)
@@ -170,7 +560,7 @@ def Mod_Tchernychova_Lyons(samp, U_svd, pt_nys, kernel, tm, mu=None, calc_obj=No
             X_tmp_raw = torch.clone(X_tmp[:, :n])
             obj_raw = X_tmp[:, -1:].reshape(-1)
         
-        w_star, idx_star, _, _, ERR, _, _ = Tchernychova_Lyons_CAR(
+        w_star, idx_star, _, _, ERR, _, _ = car(
             X_tmp, torch.clone(tot_weights), tm
         )
 
@@ -268,3 +658,112 @@ def Tchernychova_Lyons_CAR(X, mu, tm, DEBUG=False):
     w_star = mu[mu > 0]
     idx_star = tm.arange(N)[mu > 0]
     return w_star, idx_star, torch.nan, torch.nan, 0., torch.nan, torch.nan
+
+
+def _cancel_block(mu, Phi, col, k, alpha):
+    """
+    Cancel the k points with the smallest ratios alpha at once with the k null-space directions Phi[:, col:col+k].
+    The coefficients c solve the k x k system Phi_k[S] @ c = mu[S], so mu - Phi_k @ c vanishes on S,
+    and the remaining directions are eliminated on S by the same block, so that they keep the cancelled points at zero.
+    The block is rejected if it is singular, ill-conditioned, or makes any weight negative.
+
+    Args:
+        - mu: torch.tensor, the weights, updated in place if accepted
+        - Phi: torch.tensor, the null-space directions, updated in place if accepted
+        - col: int, the first unused direction
+        - k: int, the block size
+        - alpha: torch.tensor, the ratios mu / Phi[:, col], inf where Phi[:, col] <= 0
+
+    Returns:
+        - accepted: bool, true if the k points are cancelled, otherwise nothing is changed
+    """
+    S = torch.topk(alpha, k, largest=False).indices
+    Phi_k = Phi[:, col:col + k]
+    B = Phi_k[S]
+    if torch.linalg.cond(B) > torch.finfo(B.dtype).eps ** -0.5:
+        return False
+    c, info = torch.linalg.solve_ex(B, mu[S])
+    if info > 0 or not c.isfinite().all():
+        return False
+    mu_new = mu - Phi_k @ c
+    mu_new[S] = 0.
+    if mu_new.min() < - torch.finfo(mu.dtype).eps * mu.sum():
+        return False
+
+    rest = Phi[:, col + k:]
+    coef = torch.linalg.solve(B, rest[S])
+    rest.sub_(Phi_k @ coef)
+    rest[S] = 0.
+    mu.copy_(mu_new.clamp_(min=0))
+    return True
+
+
+def Tchernychova_Lyons_CAR_vectorised(X, mu, tm, DEBUG=False, block_size=16):
+    """
+    This functions reduce X from N points to n+1, with the same inputs and outputs as Tchernychova_Lyons_CAR.
+    The null-space basis and the work buffers are allocated once. Each step tries to cancel the k points with the
+    smallest ratios along the leading null-space direction at once with the k leading directions, see _cancel_block,
+    and falls back to the single cancellation with an in-place rank-one update if the block is singular or infeasible.
+    k is doubled after an accepted block up to block_size, and halved after a rejected one,
+    so that the number of Python steps is about (N - n) / k rather than N - n.
+
+    Args:
+        - block_size: int, the maximum number of points cancelled at once
+    """
+    X = torch.cat([tm.ones(X.size(0)).unsqueeze(0).T, X], dim=1)
+    N, n = X.shape
+    n_null = N - n
+
+    if n_null > 0:
+        _, _, V = torch.linalg.svd(X.T)
+        Phi = V[-n_null:, :].T.contiguous()
+        alpha = torch.empty_like(mu)
+        nonpositive = torch.empty(N, dtype=torch.bool, device=mu.device)
+
+        col = 0
+        k = block_size
+        while col < n_null:
+            phi = Phi[:, col]
+            torch.le(phi, 0, out=nonpositive)
+            if nonpositive.all():
+                break
+
+            torch.div(mu, phi, out=alpha)
+            alpha.masked_fill_(nonpositive, float("inf"))
+            k = min(k, n_null - col, int(nonpositive.logical_not().sum()))
+            if k > 1 and _cancel_block(mu, Phi, col, k, alpha):
+                col += k
+                k = min(2 * k, block_size)
+            else:
+                k = max(1, k // 2)
+                idx = torch.argmin(alpha)
+                mu.addcmul_(phi, alpha[idx], value=-1)
+
+                rest = Phi[:, col + 1:]
+                rest.addr_(phi, rest[idx] / phi[idx], alpha=-1)
+                rest[idx] = 0.
+                mu[idx] = 0.
+                col += 1
+
+            if DEBUG and (not torch.allclose(torch.sum(mu), tm.tensor(1.))):
+                warnings.warn(f"the weights sum to {torch.sum(mu).item()} after the cancellation")
+
+    w_star = mu[mu > 0]
+    idx_star = tm.arange(N)[mu > 0]
+    return w_star, idx_star, torch.nan, torch.nan, 0., torch.nan, torch.nan
+
+
+def select_car_engine(car_engine):
+    """
+    Args:
+        - car_engine: string, select from ["standard", "vectorised"]
+
+    Returns:
+        - car: function, the reduction engine from N points to n+1
+    """
+    if car_engine == "standard":
+        return Tchernychova_Lyons_CAR
+    elif car_engine == "vectorised":
+        return Tchernychova_Lyons_CAR_vectorised
+    else:
+        raise ValueError('car_engine should be from ["standard", "vectorised"]')
@@ -0,0 +1,63 @@
+import math
+import torch
+import gpytorch
+from ._utils import TensorManager
+
+
+class RandomFourierFeatures(TensorManager):
+    def __init__(self, covar_module, n_dims, n_features=1024):
+        """
+        Random Fourier features of a stationary kernel, such that k(x, y) ≈ phi(x) @ phi(y).T
+        See Rahimi, A. and Recht, B., Random features for large-scale kernel machines (NeurIPS 2007)
+
+        Args:
+        - covar_module: gpytorch.kernels.ScaleKernel, the kernel with RBFKernel or MaternKernel as the base kernel
+        - n_dims: int, the number of dimensions of inputs
+        - n_features: int, the number of Fourier features
+        """
+        super().__init__() # call TensorManager
+        self.covar_module = covar_module
+        self.n_dims = n_dims
+        self.n_features = n_features
+        self.reset_random_variables()
+
+    def spectral_samples(self):
+        """
+        Sampling from the spectral density of the base kernel with unit lengthscale
+
+        Return:
+        - W: torch.tensor, the spectral samples. torch.Size(n_dims, n_features)
+        """
+        base_kernel = self.covar_module.base_kernel
+        normal_samples = torch.randn(self.n_dims, self.n_features)
+        if isinstance(base_kernel, gpytorch.kernels.RBFKernel):
+            W = normal_samples
+        elif isinstance(base_kernel, gpytorch.kernels.MaternKernel):
+            nu = base_kernel.nu
+            gamma_samples = torch.distributions.Gamma(nu, nu).sample(torch.Size([1, self.n_features]))
+            W = normal_samples * gamma_samples.rsqrt()
+        else:
+            raise NotImplementedError("Random Fourier features support only RBFKernel and MaternKernel.")
+        return self.standardise_tensor(W)
+
+    def reset_random_variables(self):
+        """
+        Redraw the spectral samples and the phases
+        """
+        self.W = self.spectral_samples()
+        self.b = self.standardise_tensor(torch.rand(self.n_features) * 2 * math.pi)
+
+    def __call__(self, x):
+        """
+        Compute the random Fourier features at x
+
+        Args:
+        - x: torch.tensor, inputs. torch.Size(..., n_data, n_dims)
+
+        Return:
+        - phi: torch.tensor, the features. torch.Size(..., n_data, n_features)
+        """
+        lengthscale = self.covar_module.base_kernel.lengthscale.detach()
+        outputscale = self.covar_module.outputscale.detach()
+        phi = torch.cos((x / lengthscale) @ self.W + self.b)
+        return (2 * outputscale / self.n_features).sqrt() * phi
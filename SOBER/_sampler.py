@@ -1,10 +1,14 @@
 import copy
+import math
+import queue
 import torch
+import threading
+import time
 import warnings
 from ._prior import Uniform, BinaryPrior, CategoricalPrior, MixedBinaryPrior, MixedCategoricalPrior
 from ._prior_update import update_mixed_prior, update_binary_prior, update_categorical_prior, update_continuous_prior
 from ._weights import WeightsStabiliser
-from ._rchq import recombination
+from ._rchq import recombination, recombination_streaming, pivoted_cholesky_landmarks
 from ._utils import TensorManager
 
 
@@ -31,6 +35,10 @@ class RecombinationSampler(WeightsStabiliser, TensorManager):
         weights,
         batch_size,
         calc_obj=None,
+        precompute_features=False,
+        car_engine="standard",
+        backend="serial",
+        n_workers=None,
     ):
         """
         Sampling via kernel recombination.
@@ -41,6 +49,10 @@ class RecombinationSampler(WeightsStabiliser, TensorManager):
         - weights: torch.tensor, weights
         - batch_size: int, the number of batch samples
         - calc_obj: class, the acquisition function.
+        - precompute_features: bool, compute the Nyström features once per recombination if true, otherwise not.
+        - car_engine: string, the reduction engine of recombination, select from ["standard", "vectorised"]
+        - backend: string, "serial" or "process" (divide-and-conquer recombination over CPU worker processes)
+        - n_workers: int, the number of worker processes for the "process" backend. All the CPU cores if None.
         
         Return:
         - idx_rchq: torch.tensor, the indices selected for the next batch
@@ -55,8 +67,51 @@ class RecombinationSampler(WeightsStabiliser, TensorManager):
             self.dtype,
             init_weights=weights,
             calc_obj=calc_obj,
+            precompute_features=precompute_features,
+            car_engine=car_engine,
+            backend=backend,
+            n_workers=n_workers,
         )
         return idx_rchq, w_rchq
+    
+    def sampling_recombination_streaming(
+        self,
+        chunks,
+        X_nys,
+        batch_size,
+        calc_obj=None,
+        precompute_features=False,
+        car_engine="standard",
+    ):
+        """
+        Sampling via out-of-core kernel recombination over a stream of candidate chunks.
+        
+        Args:
+        - chunks: iterator, yielding (X_chunk, weights_chunk) pairs, e.g. from streaming_candidates or pipelined_candidates
+        - X_nys: torch.tensor, samples for Nyström approximation
+        - batch_size: int, the number of batch samples
+        - calc_obj: class, the acquisition function.
+        - precompute_features: bool, compute the Nyström features once per reduction if true, otherwise not.
+        - car_engine: string, the reduction engine of recombination, select from ["standard", "vectorised"]
+        
+        Return:
+        - idx_rchq: torch.tensor, the global indices over the stream selected for the next batch
+        - w_rchq: torch.tensor, the quadrature weights
+        - X_batch: torch.tensor, the next batch samples
+        """
+        idx_rchq, w_rchq, X_batch = recombination_streaming(
+            chunks,
+            X_nys,
+            batch_size,
+            self.kernel,
+            self.device,
+            self.dtype,
+            calc_obj=calc_obj,
+            precompute_features=precompute_features,
+            car_engine=car_engine,
+            return_samples=True,
+        )
+        return idx_rchq, w_rchq, X_batch
 
 class EmpiricalSampler(RecombinationSampler):
     def __init__(
@@ -66,6 +121,9 @@ class EmpiricalSampler(RecombinationSampler):
         kernel,
         thresh=5,
         label="mixedbinary", 
+        mle_method="lbfgs",
+        mle_smoothing=1e-2,
+        mle_damping=0.7,
     ):
         """
         Sampling from pi.
@@ -75,6 +133,9 @@ class EmpiricalSampler(RecombinationSampler):
         - pi: class, the class of pi
         - kernel: class, the class of kernel
         - label: string, prior type. Select from "continuous", "binary", "categorical", "mixedbinary", "mixedcategorical".
+        - mle_method: string, the MLE engine of the discrete prior update. Select from ["analytic", "lbfgs"]
+        - mle_smoothing: float, the pseudo count of Laplace smoothing of the "analytic" update
+        - mle_damping: float, the damping factor of the "analytic" update, p_new = damping * p_mle + (1 - damping) * p_old
         """
         super().__init__(kernel, thresh=thresh)  # RecombinationSampler class initialisation
         #self.prior_initial = copy.deepcopy(prior)
@@ -83,6 +144,10 @@ class EmpiricalSampler(RecombinationSampler):
         self.pi = pi
         self.label = label
         self.flag = False
+        self.mle_options = {"mle_method": mle_method, "smoothing": mle_smoothing, "damping": mle_damping}
+        if not hasattr(self, "candidate_cache"):
+            self.candidate_cache = None  # kept across update_model, see recycled_sampling
+        self.pipeline_options = None
         
     def initialise_prior(self):
         """
@@ -120,18 +185,19 @@ class EmpiricalSampler(RecombinationSampler):
         - verbose: bool, show progress if truem otherwise not.
         """
         if self.label == "mixedbinary":
-            self.prior = update_mixed_prior(X_cand, weights, self.prior, label="binary")
+            self.prior = update_mixed_prior(
+                X_cand, weights, self.prior, label="binary", **self.mle_options,
+            )
             if verbose:
                 print("The optimised weights")
                 print(self.prior.prior_binary.prior_binary.probs)
         elif self.label == "mixedcategorical":
-            self.prior = update_mixed_prior(X_cand, weights, self.prior, label="categorical")
+            self.prior = update_mixed_prior(
+                X_cand, weights, self.prior, label="categorical", **self.mle_options,
+            )
             if verbose:
                 print("The optimised weights")
-                print(self.prior.prior_disc.cat.probs.reshape(
-                    self.prior.prior_disc.n_dims,
-                    self.prior.prior_disc.n_categories,
-                ))
+                print(self.prior.prior_disc.probs)
         elif self.label == "continuous":
             self.prior = update_continuous_prior(
                 X_cand, weights, self.prior, self.prior.n_dims,
@@ -139,16 +205,14 @@ class EmpiricalSampler(RecombinationSampler):
             
         elif self.label == "categorical":
             self.prior = update_categorical_prior(
-                weights, X_cand, self.prior,
+                weights, X_cand, self.prior, **self.mle_options,
             )
             if verbose:
                 print("The optimised weights")
-                print(self.prior.cat.probs.reshape(
-                    self.prior.n_dims, self.prior.n_categories
-                ))
+                print(self.prior.probs)
         elif self.label == "binary":
             self.prior.prior_binary = update_binary_prior(
-                weights, X_cand, self.prior.prior_binary,
+                weights, X_cand, self.prior.prior_binary, **self.mle_options,
             )
             if verbose:
                 print("The optimised weights")
@@ -170,62 +234,342 @@ class EmpiricalSampler(RecombinationSampler):
         else:
             return False
     
-    def sampling(self, n_rec):
+    def sampling(self, n_rec, normalise=True):
         """
         Sampling from prior with weights
         
         Args:
         - n_rec: int, the number of samples
+        - normalise: bool, normalise the weights to sum to one if true, otherwise not.
         
         Return:
         - X_cand: torch.tensor, samples
         - weights: torch.tensor, weights
         """
+        if self.pipeline_options is not None:
+            X_cand, _, weights = self.pipelined_sampling(n_rec, normalise=normalise)
+            return X_cand, weights
         X_cand = self.prior.sample(n_rec)
         weights = self.pi(X_cand) / self.prior.pdf(X_cand)
-        weights = self.cleansing_weights(weights)
+        weights = self.cleansing_weights(weights, normalise=normalise)
         return X_cand, weights
     
-    def categorical_sampling(self, n_rec):
+    def categorical_sampling(self, n_rec, normalise=True):
         """
         Sampling from prior with weights
         
         Args:
         - n_rec: int, the number of samples
+        - normalise: bool, normalise the weights to sum to one if true, otherwise not.
         
         Return:
         - X_cand: torch.tensor, samples
         - weights: torch.tensor, weights
         """
+        if self.pipeline_options is not None:
+            return self.pipelined_sampling(n_rec, normalise=normalise)
         X_cand, X_indices = self.prior.sample_both(n_rec)
         weights = self.pi(X_cand) / self.prior.pdf(X_indices)
-        weights = self.cleansing_weights(weights)
+        weights = self.cleansing_weights(weights, normalise=normalise)
+        return X_cand, X_indices, weights
+    
+    def streaming_candidates(self, n_rec, chunk_size=100000, scale=None):
+        """
+        Sampling from prior with weights chunk by chunk, for out-of-core recombination.
+        The weights are cleaned with the same threshold for every chunk, but not normalised across chunks.
+        
+        Args:
+        - n_rec: int, the total number of samples
+        - chunk_size: int, the number of samples per chunk
+        - scale: float, the reference scale of the relative threshold frozen over all the chunks, see weights_scale.
+                 The absolute threshold as in the in-memory path if None.
+        
+        Return:
+        - generator, yielding (X_cand, weights) of each chunk
+        """
+        n_sampled = 0
+        while n_sampled < n_rec:
+            n_chunk = min(chunk_size, n_rec - n_sampled)
+            if self.check_categorical():
+                X_cand, X_indices = self.prior.sample_both(n_chunk)
+                weights = self.pi(X_cand) / self.prior.pdf(X_indices)
+            else:
+                X_cand = self.prior.sample(n_chunk)
+                weights = self.pi(X_cand) / self.prior.pdf(X_cand)
+            n_sampled += n_chunk
+            yield X_cand, self.cleansing_weights(weights, normalise=False, scale=scale)
+    
+    def pipelined_draws(self, n_rec, chunk_size=100000, n_workers=1, queue_size=4):
+        """
+        Sampling from prior with weights in a producer/consumer pipeline.
+        Worker threads draw chunks from the prior and evaluate the prior pdf, while the caller's thread
+        scores the earlier chunks with pi. The chunks are passed through a bounded queue, so at most
+        queue_size chunks are held in memory. The weights are neither cleaned nor filtered,
+        and the chunks may arrive out of order.
+        
+        The time spent on sampling by the workers, on scoring by the caller, and the wall-clock time of the
+        pipeline excluding the time the caller spends between the chunks are stored in self.pipeline_info.
+        The overlap is (time_sampling + time_scoring) / time_wall, i.e. 1 without any overlap.
+        
+        Args:
+        - n_rec: int, the total number of samples
+        - chunk_size: int, the number of samples per chunk
+        - n_workers: int, the number of worker threads producing the prior samples
+        - queue_size: int, the maximum number of chunks waiting to be scored
+        
+        Return:
+        - generator, yielding (X_cand, X_indices, weights) of each chunk, X_indices is None for non-categorical domain
+        """
+        chunks = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        lock = threading.Lock()
+        remaining = [n_rec]
+        time_sampling = [0.]
+        categorical = self.check_categorical()
+        
+        def put(item):
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce():
+            try:
+                while not stop.is_set():
+                    with lock:
+                        n_chunk = min(chunk_size, remaining[0])
+                        remaining[0] -= n_chunk
+                    if n_chunk == 0:
+                        break
+                    start = time.perf_counter()
+                    if categorical:
+                        X_cand, X_indices = self.prior.sample_both(n_chunk)
+                        pdf = self.prior.pdf(X_indices)
+                    else:
+                        X_cand, X_indices = self.prior.sample(n_chunk), None
+                        pdf = self.prior.pdf(X_cand)
+                    with lock:
+                        time_sampling[0] += time.perf_counter() - start
+                    if not put((X_cand, X_indices, pdf)):
+                        break
+            except Exception as error:
+                put(error)
+            finally:
+                put(None)
+        
+        self.pipeline_info = {"n_chunks": 0, "time_sampling": 0., "time_scoring": 0., "time_wall": 0., "overlap": 1.}
+        time_scoring = 0.
+        time_wall = 0.
+        resumed = time.perf_counter()
+        workers = [threading.Thread(target=produce, daemon=True) for _ in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        
+        n_finished = 0
+        n_chunks = 0
+        try:
+            while n_finished < n_workers:
+                item = chunks.get()
+                if item is None:
+                    n_finished += 1
+                    continue
+                elif isinstance(item, Exception):
+                    raise item
+                X_cand, X_indices, pdf = item
+                start = time.perf_counter()
+                weights = self.pi(X_cand) / pdf
+                time_scoring += time.perf_counter() - start
+                n_chunks += 1
+                time_wall += time.perf_counter() - resumed
+                resumed = None
+                yield X_cand, X_indices, weights
+                resumed = time.perf_counter()
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+            if resumed is not None:
+                time_wall += time.perf_counter() - resumed
+            with lock:
+                time_total = time_sampling[0] + time_scoring
+            self.pipeline_info = {
+                "n_chunks": n_chunks,
+                "time_sampling": time_sampling[0],
+                "time_scoring": time_scoring,
+                "time_wall": time_wall,
+                "overlap": time_total / time_wall if time_wall > 0 else 1.,
+            }
+    
+    def pipelined_candidates(self, n_rec, chunk_size=100000, n_workers=1, queue_size=4, scale=None):
+        """
+        Sampling from prior with weights in a producer/consumer pipeline, for out-of-core recombination.
+        Only the samples with positive weights are yielded, and the weights are cleaned with the same
+        threshold for every chunk, but not normalised across chunks. See pipelined_draws.
+        
+        Args:
+        - n_rec: int, the total number of samples
+        - chunk_size: int, the number of samples per chunk
+        - n_workers: int, the number of worker threads producing the prior samples
+        - queue_size: int, the maximum number of chunks waiting to be scored
+        - scale: float, the reference scale of the relative threshold frozen over all the chunks, see weights_scale.
+                 The absolute threshold as in the in-memory path if None.
+        
+        Return:
+        - generator, yielding (X_cand, weights) of the accepted samples of each chunk
+        """
+        for X_cand, _, weights in self.pipelined_draws(n_rec, chunk_size, n_workers, queue_size):
+            weights = self.cleansing_weights(weights, normalise=False, scale=scale)
+            idx = (weights > 0)
+            if idx.sum() > 0:
+                yield X_cand[idx], weights[idx]
+    
+    def pipelined_sampling(self, n_rec, normalise=True):
+        """
+        Sampling from prior with weights through pipelined_draws with the options of self.pipeline_options,
+        the drop-in replacement of sampling and categorical_sampling.
+        
+        Args:
+        - n_rec: int, the number of samples
+        - normalise: bool, normalise the weights to sum to one if true, otherwise not.
+        
+        Return:
+        - X_cand: torch.tensor, samples
+        - X_indices: torch.tensor, the category indices of samples, None for non-categorical domain
+        - weights: torch.tensor, weights
+        """
+        chunk_size = self.pipeline_options["chunk_size"]
+        if chunk_size is None:
+            chunk_size = max(1, n_rec // 8)
+        chunks = list(self.pipelined_draws(
+            n_rec, chunk_size=chunk_size, n_workers=self.pipeline_options["n_workers"],
+        ))
+        X_cand = torch.vstack([X for X, _, _ in chunks])
+        X_indices = None if chunks[0][1] is None else torch.vstack([X_idx for _, X_idx, _ in chunks])
+        weights = self.cleansing_weights(torch.cat([w for _, _, w in chunks]), normalise=normalise)
         return X_cand, X_indices, weights
     
-    def recursive_sampling(self, n_rec, n_repeat=5, verbose=False):
+    def store_candidates(self, X_cand, X_indices=None):
+        """
+        Store the candidates together with their proposal densities under the current prior for recycled_sampling
+        
+        Args:
+        - X_cand: torch.tensor, samples
+        - X_indices: torch.tensor, the category indices of samples for categorical domain
+        """
+        pdf = self.prior.pdf(X_cand if X_indices is None else X_indices)
+        self.candidate_cache = {"X_cand": X_cand, "X_indices": X_indices, "pdf": pdf}
+    
+    def recycled_sampling(self, n_rec, ess_target, chunk_size=None):
+        """
+        Sampling with weights by recycling the candidates of the previous iteration.
+        The cached candidates are rescored under the current pi and reweighted by their own proposal densities,
+        i.e. the weights are pi(x) / q_old(x). The fresh samples from the current prior with the weights pi(x) / q(x)
+        are added chunk by chunk only until the effective sample size reaches ess_target or n_rec fresh samples are drawn.
+        The latest n_rec samples are stored for the next iteration.
+        
+        Args:
+        - n_rec: int, the maximum number of samples
+        - ess_target: float, the target effective sample size
+        - chunk_size: int, the number of fresh samples per chunk. If None, n_rec // 10.
+        
+        Return:
+        - X_cand: torch.tensor, samples
+        - X_indices: torch.tensor, the category indices of samples, None for non-categorical domain
+        - weights: torch.tensor, weights
+        
+        The number of recycled and fresh samples and the effective sample size are stored in self.recycling_info.
+        """
+        if chunk_size is None:
+            chunk_size = max(1, n_rec // 10)
+        categorical = self.check_categorical()
+        X_cand = self.candidate_cache["X_cand"]
+        X_indices = self.candidate_cache["X_indices"]
+        pdf = self.candidate_cache["pdf"]
+        n_recycled = len(X_cand)
+        weights = self.cleansing_weights(self.pi(X_cand) / pdf, normalise=False)
+        
+        n_fresh = 0
+        while self.effective_sample_size(weights) < ess_target and n_fresh < n_rec:
+            n_chunk = min(chunk_size, n_rec - n_fresh)
+            if categorical:
+                X_new, X_indices_new = self.prior.sample_both(n_chunk)
+                pdf_new = self.prior.pdf(X_indices_new)
+                X_indices = torch.vstack([X_indices, X_indices_new])
+            else:
+                X_new = self.prior.sample(n_chunk)
+                pdf_new = self.prior.pdf(X_new)
+            weights_new = self.cleansing_weights(self.pi(X_new) / pdf_new, normalise=False)
+            X_cand = torch.vstack([X_cand, X_new])
+            pdf = torch.cat([pdf, pdf_new])
+            weights = torch.cat([weights, weights_new])
+            n_fresh += n_chunk
+        
+        self.candidate_cache = {
+            "X_cand": X_cand[-n_rec:],
+            "X_indices": None if X_indices is None else X_indices[-n_rec:],
+            "pdf": pdf[-n_rec:],
+        }
+        self.recycling_info = {
+            "n_recycled": n_recycled,
+            "n_fresh": n_fresh,
+            "ess": self.effective_sample_size(weights),
+        }
+        return X_cand, X_indices, self.cleansing_weights(weights)
+    
+    def recursive_sampling(self, n_rec, n_repeat=5, verbose=False, adaptive=False, max_draws=None, max_draw_size=None, keep_pool=False):
         """
         Sampling from prior with weights recursively
         
         Args:
         - n_rec: int, the number of samples
         - n_repeat: int, the number of iterations
+        - verbose: bool, show progress if truem otherwise not.
+        - adaptive: bool, if true, the acceptance rate is estimated from the samples drawn so far,
+                    and the next draw is sized to accept more than self.thresh samples in one shot.
+                    The size is doubled while no sample has been accepted.
+        - max_draws: int, the maximum total number of samples for the adaptive mode. If None, min(n_repeat, 10) * n_rec.
+        - max_draw_size: int, the maximum number of samples of a single draw for the adaptive mode,
+                         which bounds the memory of evaluating pi and the prior pdf. If None, 4 * n_rec.
+        - keep_pool: bool, keep the latest n_rec drawn samples before the zero weights are filtered out
+                     as self.drawn_pool, an unbiased draw from the prior for recycled_sampling.
         
         Return:
         - X_cand: torch.tensor, samples
         - weights: torch.tensor, weights
+        
+        The weights of each round are kept unnormalised, and normalised once over all the accepted samples,
+        so that every draw carries the same mass regardless of the size of its round.
+        The number of rounds and samples used is stored in self.sampling_info.
         """
         n_accepted = 0
+        n_drawn = 0
         X_accepted = []
         X_indices_accepted = []
         weights_accepted = []
+        pool = []
         self.flag = False
-        for i in range(n_repeat):
+        if max_draws is None:
+            max_draws = min(n_repeat, 10) * n_rec
+        if max_draw_size is None:
+            max_draw_size = 4 * n_rec
+        n_next = min(n_rec, max_draws, max_draw_size) if adaptive else n_rec
+        i = 0
+        while (i < n_repeat) if not adaptive else (n_drawn < max_draws):
             if verbose:
                 print(str(i)+"-th recursive sampling...")
             if self.check_categorical():
-                X_cand, X_indices, weights = self.categorical_sampling(n_rec)
+                X_cand, X_indices, weights = self.categorical_sampling(n_next, normalise=False)
             else:
-                X_cand, weights = self.sampling(n_rec)
+                X_cand, weights = self.sampling(n_next, normalise=False)
+            n_drawn += n_next
+            i += 1
+            if keep_pool:
+                pool.append((X_cand, X_indices if self.check_categorical() else None))
+                while sum(len(X) for X, _ in pool[1:]) >= n_rec:
+                    pool.pop(0)
             
             idx = (weights > 0)
             if not idx.sum() == 0:
@@ -237,6 +581,27 @@ class EmpiricalSampler(RecombinationSampler):
             
             if (n_accepted > self.thresh):
                 break
+            if adaptive:
+                if n_accepted == 0:
+                    n_next = 2 * n_drawn
+                else:
+                    # 20% margin over the expected number of draws to reach the target
+                    n_next = math.ceil(1.2 * (self.thresh + 1 - n_accepted) * n_drawn / n_accepted)
+                n_next = max(1, min(n_next, max_draws - n_drawn, max_draw_size))
+        
+        self.sampling_info = {
+            "rounds": i,
+            "n_drawn": n_drawn,
+            "n_accepted": n_accepted,
+            "acceptance_rate": n_accepted / n_drawn if n_drawn > 0 else 0.,
+        }
+        if verbose:
+            print(f"recursive sampling: {i} rounds, {n_drawn} samples drawn, {n_accepted} accepted")
+        if keep_pool and len(pool) > 0:
+            self.drawn_pool = (
+                torch.vstack([X for X, _ in pool])[-n_rec:],
+                None if pool[0][1] is None else torch.vstack([X_idx for _, X_idx in pool])[-n_rec:],
+            )
         
         if n_accepted == 0:
             if verbose:
@@ -260,7 +625,52 @@ class EmpiricalSampler(RecombinationSampler):
             else:
                 return X_cand, weights
     
-    def sampling_candidates(self, n_rec, n_nys, verbose=False):        
+    def select_nystrom_samples(self, X_cand, weights, n_nys, nys_method="default", nys_tol=1e-3, n_nys_min=1):
+        """
+        Select the samples for Nyström approximation
+        
+        Args:
+        - X_cand: torch.tensor, samples for recombination
+        - weights: torch.tensor, weights
+        - n_nys: int, the (maximum) number of samples for Nyström approximation
+        - nys_method: string, "default" (k-means for continuous domain, deweighted resampling otherwise),
+                      "pivoted_cholesky" (greedy pivoted Cholesky on the kernel, stopping at nys_tol)
+                      or "minibatch_kmeans" (weighted mini-batch k-means with k-means++ seeding, continuous domain only)
+        - nys_tol: float, the tolerance of the relative trace residual for "pivoted_cholesky"
+        - n_nys_min: int, the minimum number of samples for "pivoted_cholesky"
+        
+        Return:
+        - X_nys: torch.tensor, samples for Nyström approximation
+        """
+        if nys_method == "default":
+            if self.label == "continuous":
+                X_nys = self.kmeans_resampling(X_cand, n_clusters=n_nys)
+            else:
+                idx_nys = self.deweighted_resampling(weights, n_nys)
+                X_nys = X_cand[idx_nys]
+            self.nys_info = {"rank": len(X_nys), "residual": float("nan")}
+        elif nys_method == "pivoted_cholesky":
+            # the pool of landmarks resampled from the weighted candidates
+            n_pool = min(len(X_cand), 10 * n_nys)
+            X_pool = X_cand[self.weighted_resampling(weights, n_pool)]
+            idx_nys, self.nys_info = pivoted_cholesky_landmarks(
+                X_pool, self.kernel, n_nys, tol=nys_tol, min_rank=n_nys_min,
+            )
+            X_nys = X_pool[idx_nys]
+        elif nys_method == "minibatch_kmeans":
+            if not self.label == "continuous":
+                raise ValueError('nys_method "minibatch_kmeans" supports only the continuous domain')
+            X_nys = self.minibatch_kmeans_resampling(X_cand, n_clusters=n_nys, weights=weights)
+            self.nys_info = {"rank": len(X_nys), "residual": float("nan")}
+        else:
+            raise ValueError('nys_method should be from ["default", "pivoted_cholesky", "minibatch_kmeans"]')
+        return X_nys
+    
+    def sampling_candidates(
+        self, n_rec, n_nys, verbose=False, nys_method="default", nys_tol=1e-3, n_nys_min=1,
+        adaptive=False, max_draws=None, max_draw_size=None, recycle_candidates=False, ess_target=None,
+        pipelined=False, chunk_size=None, n_workers=1,
+    ):
         """
         Sampling from pi with weights
         
@@ -268,6 +678,18 @@ class EmpiricalSampler(RecombinationSampler):
         - n_rec: int, the number of samples for recombination
         - n_nys: int, the number of samples for Nyström approximation
         - verbose: bool, show progress if truem otherwise not.
+        - nys_method: string, the selection of samples for Nyström approximation, see select_nystrom_samples.
+        - nys_tol: float, the tolerance of the relative trace residual for "pivoted_cholesky"
+        - n_nys_min: int, the minimum number of samples for Nyström approximation for "pivoted_cholesky"
+        - adaptive: bool, size the draws of recursive sampling from the estimated acceptance rate, see recursive_sampling
+        - max_draws: int, the maximum total number of samples of each recursive sampling in the adaptive mode
+        - max_draw_size: int, the maximum number of samples of a single draw in the adaptive mode
+        - recycle_candidates: bool, recycle the candidates of the previous iteration if true, see recycled_sampling
+        - ess_target: float, the target effective sample size of recycled_sampling. If None, n_nys.
+        - pipelined: bool, draw from the prior in worker threads while scoring with pi, see pipelined_draws.
+                     The measured overlap of the last draw is stored in self.pipeline_info.
+        - chunk_size: int, the number of samples per chunk of the pipeline. If None, an eighth of each draw.
+        - n_workers: int, the number of worker threads of the pipeline
         
         Return:
         - X_cand: torch.tensor, samples for recombination
@@ -275,6 +697,23 @@ class EmpiricalSampler(RecombinationSampler):
         - weights: torch.tensor, weights
         """
         assert n_rec > n_nys
+        options = dict(
+            adaptive=adaptive, max_draws=max_draws, max_draw_size=max_draw_size, keep_pool=recycle_candidates,
+        )
+        self.drawn_pool = None
+        self.pipeline_options = dict(chunk_size=chunk_size, n_workers=n_workers) if pipelined else None
+        
+        if recycle_candidates and self.candidate_cache is not None:
+            if verbose:
+                print("recycling the candidates...")
+            ess_target = n_nys if ess_target is None else ess_target
+            X_cand, X_indices, weights = self.recycled_sampling(n_rec, ess_target)
+            if self.check_weights(weights):
+                self.update_prior(X_cand if X_indices is None else X_indices, weights, verbose=verbose)
+            X_nys = self.select_nystrom_samples(
+                X_cand, weights, n_nys, nys_method=nys_method, nys_tol=nys_tol, n_nys_min=n_nys_min,
+            )
+            return X_cand, X_nys, weights
         
         if verbose:
             print("initial sampling...")
@@ -289,35 +728,38 @@ class EmpiricalSampler(RecombinationSampler):
             if self.check_categorical():
                 self.update_prior(X_indices, weights, verbose=verbose)
                 self.thresh = n_nys
-                X_cand, _, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose)
+                X_cand, X_indices, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose, **options)
             else:
                 self.update_prior(X_cand, weights, verbose=verbose)
                 self.thresh = n_nys
-                X_cand, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose)
+                X_cand, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose, **options)
         else:
             print("Failed to update prior. Trying recursive sampling...")
             if self.check_categorical():
-                X_cand, X_indices, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose)
+                X_cand, X_indices, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose, **options)
                 if self.flag:
                     X_nys = X_cand[:n_nys]
                     return X_cand, X_nys, weights
                 self.update_prior(X_indices, weights, verbose=verbose)
                 self.thresh = n_nys
-                X_cand, _, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose)
+                X_cand, X_indices, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose, **options)
             else:
-                X_cand, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose)
+                X_cand, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose, **options)
                 if self.flag:
                     X_nys = X_cand[:n_nys]
                     return X_cand, X_nys, weights
                 self.update_prior(X_cand, weights)
                 self.thresh = n_nys
-                X_cand, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose)
+                X_cand, weights = self.recursive_sampling(n_rec, n_repeat=self.thresh, verbose=verbose, **options)
         
-        if self.label == "continuous":
-            X_nys = self.kmeans_resampling(X_cand, n_clusters=n_nys)
-        else:
-            idx_nys = self.deweighted_resampling(weights, n_nys)
-            X_nys = X_cand[idx_nys]
+        X_nys = self.select_nystrom_samples(
+            X_cand, weights, n_nys, nys_method=nys_method, nys_tol=nys_tol, n_nys_min=n_nys_min,
+        )
+        if verbose:
+            print(f"Nyström rank: {self.nys_info['rank']}, relative trace residual: {self.nys_info['residual']:.3e}")
+        if recycle_candidates and self.drawn_pool is not None:
+            # the drawn samples before filtering, as the accepted ones are truncated to nonzero weights under the old pi
+            self.store_candidates(*self.drawn_pool)
         
         self.thresh = copy.deepcopy(self.thresh_initial)
         return X_cand, X_nys, weights
@@ -348,38 +790,66 @@ class EmpiricalSampler(RecombinationSampler):
         idx_sampled = indices[:n_pruned]
         return idx_sampled
     
-    def sampling_datasets(self, n_rec, n_nys):
+    def sampling_datasets(self, n_rec, n_nys, chunk_size=100000):
         """
-        Sampling from dataset with weights
+        Sampling from dataset with weights.
+        pi is evaluated chunk by chunk, and only the pruned candidates are gathered from the dataset.
+        Without pruning, only the Nyström samples are gathered, and the candidates are left in the dataset
+        to be streamed chunk by chunk with the returned weights, see streaming_datasets.
         
         Args:
         - n_rec: int, the number of samples for recombination
         - n_nys: int, the number of samples for Nyström approximation
+        - chunk_size: int, the number of candidates per chunk to evaluate pi
         
         Return:
-        - X_cand: torch.tensor, samples for recombination
+        - idx_sampled: (only with pruning) torch.tensor, the dataset indices where X_cand is sampled
+        - X_cand: (only with pruning) torch.tensor, samples for recombination
         - X_nys: torch.tensor, samples for Nyström approximation
         - weights: torch.tensor, weights
-        - idx_sampled: (optional) torch.tensor, indices where X_cand is sampled
         """
         assert n_rec > n_nys
     
-        X_cand = self.prior.available_candidates()
-        weights = self.pi(X_cand)
+        weights = torch.cat([
+            self.pi(X_chunk) for X_chunk in self.prior.iterate_candidates(chunk_size)
+        ])
         
         if self.dataset_pruning:
-            idx_sampled = self.adaptive_pruning(weights, n_rec, n_nys)
-            X_cand = X_cand[idx_sampled]
-            weights = weights[idx_sampled]
+            idx_pruned = self.adaptive_pruning(weights, n_rec, n_nys)
+            idx_sampled = self.prior.global_index(idx_pruned)
+            X_cand = self.prior.features[idx_sampled]
+            weights = self.cleansing_weights(weights[idx_pruned])
+            idx_nys = self.deweighted_resampling(weights, n_nys)
+            return idx_sampled, X_cand, X_cand[idx_nys], weights
+        else:
+            weights = self.cleansing_weights(weights)
+            idx_nys = self.deweighted_resampling(weights, n_nys)
+            X_nys = self.prior.features[self.prior.global_index(idx_nys)]
+            return X_nys, weights
+
+    def streaming_datasets(self, chunk_size=100000, weights=None, scale=None):
+        """
+        Weighting the dataset chunk by chunk, for out-of-core recombination.
+        The global indices returned by recombination refer to prior.available_candidates(),
+        and are mapped to the dataset indices by prior.global_index.
         
-        weights = self.cleansing_weights(weights)
-        idx_nys = self.deweighted_resampling(weights, n_nys)
-        X_nys = X_cand[idx_nys]
+        Args:
+        - chunk_size: int, the number of candidates per chunk
+        - weights: torch.tensor, the weights over the available candidates, e.g. from sampling_datasets.
+                   If None, pi is evaluated per chunk.
+        - scale: float, the reference scale of the relative threshold frozen over all the chunks, see weights_scale.
+                 The absolute threshold as in the in-memory path if None.
         
-        if self.dataset_pruning:
-            return idx_sampled, X_cand, X_nys, weights
-        else:
-            return X_cand, X_nys, weights
+        Return:
+        - generator, yielding (X_cand, weights) of each chunk
+        """
+        if weights is not None:
+            for start, X_cand in zip(range(0, len(weights), chunk_size), self.prior.iterate_candidates(chunk_size)):
+                yield X_cand, weights[start:start + chunk_size]
+            return
+        for X_cand in self.prior.iterate_candidates(chunk_size):
+            weights = self.pi(X_cand)
+            yield X_cand, self.cleansing_weights(weights, normalise=False, scale=scale)
 
 class MixtureSampler:
     def __init__(self, prior, sober, ratio_wkde=0.5):
@@ -15,6 +15,9 @@ class Sober(EmpiricalSampler):
         sampler_type="lfi",
         kernel_type="predictive_covariance",
         dataset_pruning=True,
+        mle_method="lbfgs",
+        mle_smoothing=1e-2,
+        mle_damping=0.7,
     ):
         """
         Batch Bayesian optimisation as batch Bayesian quadrature
@@ -27,8 +30,11 @@ class Sober(EmpiricalSampler):
         - thresh: int, the number of non-zero weights which regrads anomalies.
         - sampler_type: string, Select from "lfi" or "ts".
                         LFI = likelihood-free inference, TS = Thompson sampling
-        - kernel_type: string, Select from ["predictive_covariance", "weighted_predictive_covariance"]
+        - kernel_type: string, Select from ["predictive_covariance", "weighted_predictive_covariance", "rff"]
         - dataset_pruning: bool, perform pruning for dataset prior if true, otherwise not.
+        - mle_method: string, the MLE engine of the discrete prior update. Select from ["analytic", "lbfgs"]
+        - mle_smoothing: float, the pseudo count of Laplace smoothing of the "analytic" update
+        - mle_damping: float, the damping factor of the "analytic" update, from 0 (no update) to 1 (pure MLE)
         """
         self.sampler_type = sampler_type
         self.kernel_type = kernel_type
@@ -36,7 +42,10 @@ class Sober(EmpiricalSampler):
         self.check_model_type(model)
         pi, kernel = self.initialisation(model)
         self.n_batches_until_reset = 3
-        super().__init__(prior, pi, kernel, label=prior.type)  # EmpiricalSampler class initialisation
+        super().__init__(
+            prior, pi, kernel, label=prior.type,
+            mle_method=mle_method, mle_smoothing=mle_smoothing, mle_damping=mle_damping,
+        )  # EmpiricalSampler class initialisation
     
     def check_model_type(self, model):
         # check fully Bayesian GP model or not
@@ -61,10 +70,10 @@ class Sober(EmpiricalSampler):
         - model: gpytorch.models, function of GP model.
         """
         if self.fbgp:
-            pi = PI_FBGP(model)
+            pi = PI_FBGP(model, label=self.sampler_type)
             kernel = model.marginal_predictive_covariance
         elif self.is_bq:
-            pi = PI_BQ(model)
+            pi = PI_BQ(model, label=self.sampler_type)
             kernel = model.gspace_kernel
         else:
             pi = PI(model, label=self.sampler_type)
@@ -79,7 +88,29 @@ class Sober(EmpiricalSampler):
         - model: gpytorch.models, function of GP model.
         """
         pi, kernel = self.initialisation(model)
-        super().__init__(self.prior, pi, kernel, thresh=self.thresh, label=self.prior.type)
+        super().__init__(
+            self.prior, pi, kernel, thresh=self.thresh, label=self.prior.type,
+            mle_method=self.mle_options["mle_method"],
+            mle_smoothing=self.mle_options["smoothing"],
+            mle_damping=self.mle_options["damping"],
+        )
+    
+    def refresh_pi(self, n_pool):
+        """
+        Fix the maximisers of the sample paths of TS over a pool drawn from the current prior,
+        once per iteration, so that all the weights of the iteration are computed against the same pi.
+        No-op for LFI.
+        
+        Args:
+        - n_pool: int, the number of inputs of the pool
+        """
+        if not self.sampler_type == "ts":
+            return
+        if self.label == "dataset":
+            _, X_pool = self.prior.sample_feature(n_pool)
+        else:
+            X_pool = self.prior.sample(n_pool)
+        self.pi.refresh(X_pool)
     
     def should_reset_prior(self, batch_size, recycle_prior):
         """
@@ -130,6 +161,16 @@ class Sober(EmpiricalSampler):
         calc_obj=None, 
         return_weights=False,
         recycle_prior=True,
+        nys_method="default",
+        nys_tol=1e-3,
+        adaptive_sampling=False,
+        recycle_candidates=False,
+        pipelined_sampling=False,
+        n_workers=1,
+        precompute_features=False,
+        car_engine="standard",
+        backend="serial",
+        n_processes=None,
         verbose=False,
     ):
         """
@@ -142,6 +183,17 @@ class Sober(EmpiricalSampler):
         - calc_obj: class, the acquisition function (AF). Do not use AF if None.
         - return_weights: bool, return quadrature weights if true, otherwise not.
         - recycle_prior: bool, recycle the previous prior if true, otherwise not.
+        - nys_method: string, the selection of samples for Nyström approximation. Select from ["default", "pivoted_cholesky", "minibatch_kmeans"]
+        - nys_tol: float, the tolerance of the relative trace residual for "pivoted_cholesky"
+        - adaptive_sampling: bool, size the draws of recursive sampling from the estimated acceptance rate
+        - recycle_candidates: bool, recycle the candidates of the previous iteration with importance reweighting
+        - pipelined_sampling: bool, draw from the prior in worker threads while scoring the candidates with pi
+        - n_workers: int, the number of worker threads for pipelined_sampling
+        - precompute_features: bool, compute the Nyström features once per recombination if true, otherwise not.
+        - car_engine: string, the reduction engine of recombination. Select from ["standard", "vectorised"]
+        - backend: string, "serial" or "process" (divide-and-conquer recombination over CPU worker processes).
+                   The dataset without pruning is streamed, which runs on the serial backend.
+        - n_processes: int, the number of worker processes for the "process" backend. All the CPU cores if None.
         - verbose: bool, show progress if truem otherwise not.
         
         Return:
@@ -154,31 +206,52 @@ class Sober(EmpiricalSampler):
             if self.should_reset_prior(batch_size, recycle_prior):
                 print("The prior was initialised.")
                 self.initialise_prior()
-            X_cand, X_nys, weights = self.sampling_candidates(n_rec, n_nys, verbose=verbose)
+            self.refresh_pi(n_rec)
+            X_cand, X_nys, weights = self.sampling_candidates(
+                n_rec, n_nys, verbose=verbose, nys_method=nys_method, nys_tol=nys_tol, n_nys_min=batch_size,
+                adaptive=adaptive_sampling, recycle_candidates=recycle_candidates,
+                pipelined=pipelined_sampling, n_workers=n_workers,
+            )
         else:
+            self.refresh_pi(n_rec)
             empirical_measure = self.sampling_datasets(n_rec, n_nys)
             if self.dataset_pruning:
                 idx_sampled, X_cand, X_nys, weights = empirical_measure
             else:
-                X_cand, X_nys, weights = empirical_measure
+                X_nys, weights = empirical_measure
             
         if verbose:
             intermidiate = time.monotonic()
             print(f"--- Finished {intermidiate - start:.3e} [s]")
             print("|| summary of sampling ||")
-            print(f" # of recombination samples: {len(X_cand):.3e}")
+            print(f" # of recombination samples: {len(weights):.3e}")
             print(f" # of Nyström samples: {len(X_nys):.3e}")
             print(f" # of nonzero weights: {(weights > 0).sum():.3e}")
             print("--- Start kernel recombination...")
         
-        idx_rchq, w_rchq = self.sampling_recombination(
-            X_cand,
-            X_nys,
-            weights,
-            batch_size,
-            calc_obj=calc_obj,
-        )
-        X_batch = X_cand[idx_rchq]
+        if self.label == "dataset" and not self.dataset_pruning:
+            # stream the dataset with the computed weights rather than gathering all the candidates
+            idx_rchq, w_rchq, X_batch = self.sampling_recombination_streaming(
+                self.streaming_datasets(weights=weights),
+                X_nys,
+                batch_size,
+                calc_obj=calc_obj,
+                precompute_features=precompute_features,
+                car_engine=car_engine,
+            )
+        else:
+            idx_rchq, w_rchq = self.sampling_recombination(
+                X_cand,
+                X_nys,
+                weights,
+                batch_size,
+                calc_obj=calc_obj,
+                precompute_features=precompute_features,
+                car_engine=car_engine,
+                backend=backend,
+                n_workers=n_processes,
+            )
+            X_batch = X_cand[idx_rchq]
         if verbose:
             end = time.monotonic()
             print(f"--- Finished all tasks {end - start:.3e} [s]")
@@ -190,6 +263,7 @@ class Sober(EmpiricalSampler):
                 idx_rchq = idx_sampled[idx_rchq]
                 return idx_rchq, X_batch
             else:
+                idx_rchq = self.prior.global_index(idx_rchq)
                 return idx_rchq, X_batch
         else:
             return X_batch
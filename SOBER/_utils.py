@@ -1,5 +1,6 @@
 import torch
 import warnings
+import threading
 from torch.quasirandom import SobolEngine
 from torch.distributions.multivariate_normal import MultivariateNormal
 from ._settings import setting_parameters
@@ -75,6 +76,69 @@ class TensorManager:
         else:
             return False
 
+class QMCStream(TensorManager):
+    def __init__(self, n_dims, seed=None):
+        """
+        Persistent scrambled Sobol sequence.
+        Successive draws continue the same sequence instead of restarting from a freshly scrambled one,
+        so the union of the draws keeps the low-discrepancy property and the scrambling cost is paid once.
+        Drawing is guarded by a lock, so that the stream can be shared by producer threads.
+        
+        Args:
+        - n_dims: int, the number of dimensions
+        - seed: int, the seed of scrambling. Random if None.
+        """
+        super().__init__() # call TensorManager
+        self.n_dims = n_dims
+        self.max_samples = 2**30  # the maximum length of the Sobol sequence of SobolEngine
+        self.lock = threading.Lock()
+        self.rescramble(seed=seed)
+        
+    def rescramble(self, seed=None):
+        """
+        Restart the stream from a newly scrambled Sobol sequence
+        
+        Args:
+        - seed: int, the seed of scrambling. Random if None.
+        """
+        self.engine = SobolEngine(self.n_dims, scramble=True, seed=seed)
+        
+    def fast_forward(self, n_samples):
+        """
+        Skip the next n_samples points of the stream
+        
+        Args:
+        - n_samples: int, the number of points to skip
+        """
+        with self.lock:
+            self.engine.fast_forward(n_samples)
+            
+    def draw(self, n_samples):
+        """
+        Draw the next n_samples points of the stream.
+        The stream is rescrambled when the sequence is exhausted.
+        
+        Args:
+        - n_samples: int, the number of samples
+        
+        Return:
+        - samples: torch.tensor, the quasi-random samples in the unit cube. torch.Size(n_samples, n_dims)
+        """
+        with self.lock:
+            if self.engine.num_generated + n_samples > self.max_samples:
+                self.rescramble()
+            samples = self.engine.draw(n_samples)
+        return self.standardise_tensor(samples)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
 class SafeTensorOperator(TensorManager):
     def __init__(self):
         super().__init__()
@@ -18,25 +18,69 @@ class WeightsStabiliser:
         self.eps_weights = eps
         self.thresh = thresh
         
-    def cleansing_weights(self, weights):
+    def weights_scale(self, weights, scale=None):
         """
-        Remove anomalies from the computed weights
+        The reference scale of the relative anomaly threshold, the maximum finite weight.
+        For weights computed chunk by chunk, pass the previous scale to take the maximum over the chunks,
+        e.g. over a pilot draw to freeze the scale before streaming.
         
         Args:
         - weights: torch.tensor, weights
+        - scale: float, the running maximum over the previous chunks. Ignored if None.
+        
+        Return:
+        - scale: float, the maximum finite weight so far
+        """
+        finite = weights[weights.isfinite()]
+        scale_new = finite.max().item() if len(finite) > 0 else 0.
+        if scale is None:
+            return scale_new
+        return max(scale, scale_new)
+        
+    def cleansing_weights(self, weights, normalise=True, scale=None):
+        """
+        Remove anomalies from the computed weights.
+        The weights smaller than eps_weights are regarded as zero. If scale is given,
+        the threshold is eps_weights relative to scale instead, so that it does not depend on the scale of pi.
+        
+        Args:
+        - weights: torch.tensor, weights
+        - normalise: bool, normalise the weights to sum to one if true, otherwise not.
+        - scale: float, the reference scale of the relative threshold, see weights_scale. The absolute threshold if None.
         
         Return:
         - weights: torch.tensor, the cleaned weights
         """
-        weights[weights < self.eps_weights] = 0
-        weights[weights.isinf()] = self.eps_weights
-        weights[weights.isnan()] = self.eps_weights
-        if not weights.sum() == 0:
+        if scale is not None and scale > 0:
+            thresh = self.eps_weights * scale
+        else:
+            thresh = self.eps_weights
+        weights[weights < thresh] = 0
+        weights[weights.isinf()] = thresh
+        weights[weights.isnan()] = thresh
+        if not normalise:
+            return weights.detach()
+        elif not weights.sum() == 0:
             weights /= weights.sum()
         else:
             weights = torch.ones_like(weights)/len(weights)
         return weights.detach()
     
+    def effective_sample_size(self, weights):
+        """
+        Compute the effective sample size (sum w)^2 / sum w^2 of the weights
+        
+        Args:
+        - weights: torch.tensor, weights
+        
+        Return:
+        - ess: float, the effective sample size
+        """
+        sum_squares = weights.pow(2).sum()
+        if sum_squares == 0:
+            return 0.
+        return (weights.sum().pow(2) / sum_squares).item()
+    
     def check_weights(self, weights):
         """
         Check weights anomalies
@@ -54,7 +98,7 @@ class WeightsStabiliser:
         else:
             return True
         
-    def weighted_resampling(self, weights, n_nys):
+    def weighted_resampling(self, weights, n_nys, scheme="multinomial", replacement=False):
         """
         Weighted resampling.
         len(weights) > n_nys should be satisfied.
@@ -62,13 +106,36 @@ class WeightsStabiliser:
         Args:
         - weights: torch.tensor, weights
         - n_nys: int, the number of resamples
+        - scheme: string, select from ["multinomial", "systematic", "stratified", "residual"].
+                  The schemes other than multinomial run in a single cumulative-sum pass.
+        - replacement: bool, resample with replacement if true, otherwise not.
+                       Without replacement is supported for "multinomial" and "systematic".
+                       The latter samples with the inclusion probabilities proportional to the weights
+                       capped at one, see systematic_resampling_without_replacement.
         
         Return:
         - idx_nys: torch.tensor, the indices where the resamples locate.
         """
+        if replacement:
+            if scheme == "multinomial":
+                return torch.multinomial(weights, n_nys, replacement=True)
+            elif scheme == "systematic":
+                return systematic_resampling(weights, n_nys)
+            elif scheme == "stratified":
+                return stratified_resampling(weights, n_nys)
+            elif scheme == "residual":
+                return residual_resampling(weights, n_nys)
+            else:
+                raise ValueError('scheme should be from ["multinomial", "systematic", "stratified", "residual"]')
+        elif not scheme in ["multinomial", "systematic"]:
+            raise ValueError('Resampling without replacement supports only "multinomial" and "systematic" schemes')
+        
         n_positive_weights = (weights > 0).sum()
         if n_positive_weights > n_nys:
-            idx_nys = torch.multinomial(weights, n_nys)
+            if scheme == "multinomial":
+                idx_nys = torch.multinomial(weights, n_nys)
+            else:
+                idx_nys = systematic_resampling_without_replacement(weights, n_nys)
         else:
             idx_positive = torch.arange(len(weights))[weights > 0]
             idx_rand = torch.randperm(len(weights))[:int(n_nys - n_positive_weights)]
@@ -76,25 +143,156 @@ class WeightsStabiliser:
             warnings.warn("Non-zero weights are fewer than n_Nys: "+str(idx_nys.sum()))
         return idx_nys
     
-    def deweighted_resampling(self, weights, n_samples):
+    def deweighted_resampling(self, weights, n_samples, scheme="multinomial"):
         """
         Uniform resampling from weighted samples
         
         Args:
         - weights: torch.tensor, the unnormalised weights
         - n_samples, int, the number of uniform samples
+        - scheme: string, the resampling scheme without replacement, select from ["multinomial", "systematic"]
         
         Return:
         - indice: torch.tensor, the indices of the selected uniform samples
         """
         weights_inv = (1 / weights)
         weights_inv = self.cleansing_weights(weights_inv)
-        indice = self.weighted_resampling(weights_inv, n_samples)
+        indice = self.weighted_resampling(weights_inv, n_samples, scheme=scheme)
         return indice
     
     def kmeans_resampling(self, X, n_clusters=100):
         _, X_sparse = KMeans(X, n_clusters)
         return X_sparse
+    
+    def minibatch_kmeans_resampling(self, X, n_clusters=100, weights=None, batch_size=1024, tol=1e-4):
+        """
+        Resampling via weighted mini-batch k-means with k-means++ seeding
+        
+        Args:
+        - X: torch.tensor, samples
+        - n_clusters: int, the number of centroids
+        - weights: torch.tensor, the weights of samples. Uniform if None.
+        - batch_size: int, the number of samples per mini-batch
+        - tol: float, the tolerance of the centroid shift relative to the total variance of X
+        
+        Return:
+        - X_sparse: torch.tensor, the centroids
+        """
+        _, X_sparse = MiniBatchKMeans(X, n_clusters, weights=weights, batch_size=batch_size, tol=tol)
+        return X_sparse
+
+
+def systematic_counts(cumsum, u):
+    """
+    Count the positions u, u + 1, u + 2, ... that fall in each interval of the cumulative sum.
+    
+    Args:
+    - cumsum: torch.tensor, the cumulative sum of the (scaled) weights, whose last element is the number of positions
+    - u: torch.tensor, the offset of the positions in [0, 1)
+    
+    Return:
+    - counts: torch.tensor, the number of positions per interval
+    """
+    n = cumsum[-1].round().long()
+    n_below = (cumsum - u).floor().long().add(1).clamp(min=0, max=n.item())
+    return n_below.diff(prepend=n_below.new_zeros(1))
+
+
+def systematic_resampling(weights, n):
+    """
+    Systematic resampling with replacement in O(N + n).
+    A single uniform offset u is drawn, and the i-th sample is copied as many times as the positions
+    (u + j) / n, j = 0, ..., n-1, that fall in its interval of the normalised cumulative weights.
+    
+    Args:
+    - weights: torch.tensor, the unnormalised weights
+    - n: int, the number of resamples
+    
+    Return:
+    - idx: torch.tensor, the indices of the resamples
+    """
+    cumsum = n * weights.cumsum(0) / weights.sum()
+    counts = systematic_counts(cumsum, torch.rand(1, dtype=cumsum.dtype, device=cumsum.device))
+    return torch.arange(len(weights), device=weights.device).repeat_interleave(counts)
+
+
+def stratified_resampling(weights, n):
+    """
+    Stratified resampling with replacement.
+    The positions (j + u_j) / n have an independent uniform offset u_j per stratum.
+    
+    Args:
+    - weights: torch.tensor, the unnormalised weights
+    - n: int, the number of resamples
+    
+    Return:
+    - idx: torch.tensor, the indices of the resamples
+    """
+    cdf = weights.cumsum(0) / weights.sum()
+    positions = (torch.arange(n, dtype=cdf.dtype, device=cdf.device) + torch.rand(n, dtype=cdf.dtype, device=cdf.device)) / n
+    return torch.searchsorted(cdf, positions, right=True).clamp(max=len(weights) - 1)
+
+
+def residual_resampling(weights, n):
+    """
+    Residual resampling with replacement.
+    Each sample is first copied floor(n w_i) times, and the rest is resampled systematically from the residuals.
+    
+    Args:
+    - weights: torch.tensor, the unnormalised weights
+    - n: int, the number of resamples
+    
+    Return:
+    - idx: torch.tensor, the indices of the resamples
+    """
+    scaled = n * weights / weights.sum()
+    counts = scaled.floor().long()
+    n_residual = n - counts.sum().item()
+    if n_residual > 0:
+        residual = scaled - counts
+        cumsum = n_residual * residual.cumsum(0) / residual.sum()
+        counts += systematic_counts(cumsum, torch.rand(1, dtype=cumsum.dtype, device=cumsum.device))
+    return torch.arange(len(weights), device=weights.device).repeat_interleave(counts)
+
+
+def inclusion_probabilities(weights, n):
+    """
+    Compute the inclusion probabilities proportional to the weights that sum to n, capped at one.
+    The capped samples are fixed at one, and the rest is rescaled until no probability exceeds one.
+    
+    Args:
+    - weights: torch.tensor, the unnormalised weights, with more than n positive elements
+    - n: int, the number of samples
+    
+    Return:
+    - probs: torch.tensor, the inclusion probabilities
+    """
+    capped = torch.zeros(len(weights), dtype=torch.bool, device=weights.device)
+    probs = n * weights / weights.sum()
+    while (probs > 1).any():
+        capped = capped | (probs >= 1)
+        weights_free = weights.masked_fill(capped, 0)
+        probs = (n - capped.sum()) * weights_free / weights_free.sum()
+        probs[capped] = 1
+    return probs
+
+
+def systematic_resampling_without_replacement(weights, n):
+    """
+    Systematic sampling without replacement (Madow's method) in O(N) per capping iteration.
+    Systematic positions are laid over the cumulative inclusion probabilities, which are at most one,
+    so that each sample is selected at most once.
+    
+    Args:
+    - weights: torch.tensor, the unnormalised weights, with more than n positive elements
+    - n: int, the number of samples
+    
+    Return:
+    - idx: torch.tensor, the indices of the n distinct samples
+    """
+    cumsum = inclusion_probabilities(weights, n).cumsum(0)
+    counts = systematic_counts(cumsum, torch.rand(1, dtype=cumsum.dtype, device=cumsum.device))
+    return torch.where(counts > 0)[0]
 
 
 def KMeans(x, K=10, Niter=10):
@@ -123,4 +321,99 @@ def KMeans(x, K=10, Niter=10):
         Ncl = torch.bincount(cl, minlength=K).type_as(c).view(K, 1)
         c /= Ncl  # in-place division to compute the average
 
-    return cl, c
\ No newline at end of file
+    return cl, c
+
+def nearest_centroids(x, c, block_size=10000):
+    """
+    Assign points to the closest centroids with blockwise distances,
+    so that at most block_size x K distances are held in memory.
+    
+    Args:
+    - x: torch.tensor, the point cloud. torch.Size(N, D)
+    - c: torch.tensor, the centroids. torch.Size(K, D)
+    - block_size: int, the number of points per block
+    
+    Return:
+    - cl: torch.tensor, the labels of the closest centroids. torch.Size(N)
+    - d2: torch.tensor, the squared distances to the closest centroids. torch.Size(N)
+    """
+    cl, d2 = [], []
+    for x_block in torch.split(x, block_size):
+        d2_block, cl_block = torch.cdist(x_block, c).min(dim=1)
+        cl.append(cl_block)
+        d2.append(d2_block.pow(2))
+    return torch.cat(cl), torch.cat(d2)
+
+
+def kmeans_plusplus(x, K, weights=None):
+    """
+    k-means++ seeding. Each centroid is sampled with the probability proportional to
+    weights times the squared distance to the closest centroid selected so far.
+    
+    Args:
+    - x: torch.tensor, the point cloud. torch.Size(N, D)
+    - K: int, the number of centroids
+    - weights: torch.tensor, the weights of points. Uniform if None.
+    
+    Return:
+    - c: torch.tensor, the initial centroids. torch.Size(K, D)
+    """
+    if weights is None:
+        weights = torch.ones(len(x), dtype=x.dtype, device=x.device)
+    idx = [torch.multinomial(weights, 1)]
+    d2 = (x - x[idx[0]]).pow(2).sum(-1)
+    for _ in range(K - 1):
+        p = weights * d2
+        if p.sum() > 0:
+            idx_next = torch.multinomial(p, 1)
+        else:
+            idx_next = torch.multinomial(weights, 1)
+        idx.append(idx_next)
+        d2 = torch.minimum(d2, (x - x[idx_next]).pow(2).sum(-1))
+    return x[torch.cat(idx)].clone()
+
+
+def MiniBatchKMeans(x, K=10, weights=None, batch_size=1024, Niter=100, tol=1e-4, block_size=10000):
+    """
+    Implements weighted mini-batch k-means for the Euclidean metric with k-means++ seeding.
+    Sculley, D., Web-scale k-means clustering (WWW 2010)
+    The mini-batches are sampled proportionally to the weights, and each centroid moves towards
+    the mean of its assigned points with the learning rate of the inverse cumulative count.
+    The distances are computed blockwise, so the (N, K, D) tensor is never materialised.
+    
+    Args:
+    - x: torch.tensor, the point cloud. torch.Size(N, D)
+    - K: int, the number of centroids
+    - weights: torch.tensor, the weights of points. Uniform if None.
+    - batch_size: int, the number of points per mini-batch
+    - Niter: int, the maximum number of iterations
+    - tol: float, stop if the largest squared shift of the centroids is smaller than tol times the total variance of x
+    - block_size: int, the number of points per block of the distance computation
+    
+    Return:
+    - cl: torch.tensor, the labels of the closest centroids. torch.Size(N)
+    - c: torch.tensor, the centroids. torch.Size(K, D)
+    """
+    N, D = x.shape
+    if weights is None:
+        weights = torch.ones(N, dtype=x.dtype, device=x.device)
+    c = kmeans_plusplus(x, K, weights=weights)
+    counts = torch.zeros(K, dtype=x.dtype, device=x.device)
+    scale = x.var(dim=0).sum()
+    
+    for i in range(Niter):
+        x_batch = x[torch.multinomial(weights, batch_size, replacement=True)]
+        cl_batch, _ = nearest_centroids(x_batch, c, block_size=block_size)
+        n_batch = torch.bincount(cl_batch, minlength=K).type_as(c)
+        sums = torch.zeros_like(c).index_add_(0, cl_batch, x_batch)
+        counts += n_batch
+        
+        eta = (n_batch / counts.clamp(min=1)).view(K, 1)
+        means = sums / n_batch.clamp(min=1).view(K, 1)
+        shift = eta * (means - c)
+        c += shift
+        if shift.pow(2).sum(-1).max() < tol * scale:
+            break
+    
+    cl, _ = nearest_centroids(x, c, block_size=block_size)
+    return cl, c
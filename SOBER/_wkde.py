@@ -1,10 +1,11 @@
 import copy
+import math
 import torch
 import warnings
 import matplotlib.pyplot as plt
 from torch.distributions.multivariate_normal import MultivariateNormal
 from ._utils import SafeTensorOperator
-from ._weights import WeightsStabiliser
+from ._weights import WeightsStabiliser, MiniBatchKMeans
 from ._prior import BasePrior
 from .mvnorm import multivariate_normal_cdf as Phi
 
@@ -22,6 +23,13 @@ class WeightedKernelDensityEstimation(
         n_kde=4096,
         bw_method='scott',
         compute_cdf=False,
+        resampling_scheme="multinomial",
+        pdf_method="whitened",
+        block_size=None,
+        sample_method="vectorised",
+        rtol=1e-2,
+        n_clusters=None,
+        max_exact_ratio=0.1,
     ):
         """
         Class of weighted kernel density estimation with Gaussian kernel.
@@ -35,6 +43,15 @@ class WeightedKernelDensityEstimation(
         - bw_method: string, 'scott' or 'silverman'
         - compute_cdf: bool, compute normalised PDF of truncated multivariate normal distributions if true, otherwise not.
                              The default is false as it produces significant overhead.
+        - resampling_scheme: string, the scheme to resample the Gaussians, select from ["multinomial", "systematic"]
+        - pdf_method: string, the PDF engine, select from ["whitened", "tree", "mvn"]. See pdf.
+        - block_size: int, the number of rows of X evaluated at once by the "whitened" engine.
+                      If None, block_size * n_kde is kept around 2^22 elements.
+        - sample_method: string, the sampler, select from ["vectorised", "loop"]. See sample.
+        - rtol: float, the relative error tolerance of the PDF for the "tree" engine
+        - n_clusters: int, the number of clusters of the Gaussians for the "tree" engine. If None, sqrt(n_kde).
+        - max_exact_ratio: float, the maximum fraction of the pairs of X and the Gaussians evaluated exactly
+                           by the "tree" engine, above which the block falls back to the "whitened" engine.
         """
         WeightsStabiliser.__init__(self, eps=0, thresh=n_kde) # inherit WeightsStabiliser class
         SafeTensorOperator.__init__(self) # inherit SafeTensorOperator class
@@ -44,6 +61,13 @@ class WeightedKernelDensityEstimation(
         self.n_kde_init = min([n_kde, len(X)])
         self.bw_method = bw_method
         self.compute_cdf = compute_cdf
+        self.resampling_scheme = resampling_scheme
+        self.pdf_method = pdf_method
+        self.block_size = block_size
+        self.sample_method = sample_method
+        self.rtol = rtol
+        self.n_clusters = n_clusters
+        self.max_exact_ratio = max_exact_ratio
         self.type = "continuous"
         self.initialisation(X, W)
         
@@ -60,7 +84,7 @@ class WeightedKernelDensityEstimation(
         """
         self.initialise_n_kde()
         if self.check_weights(Y):
-            idx_accept = self.deweighted_resampling(Y, self.n_kde)
+            idx_accept = self.deweighted_resampling(Y, self.n_kde, scheme=self.resampling_scheme)
         else:
             idx_accept = self.arange(Y.size(0))[self.cleansing_weights(Y) > 0]
             self.n_kde = len(idx_accept)
@@ -68,7 +92,7 @@ class WeightedKernelDensityEstimation(
                 raise ValueError("Invalid weights")
             elif self.n_kde > self.n_kde_init:
                 self.initialise_n_kde()
-                idx_accept = self.deweighted_resampling(Y, self.n_kde)
+                idx_accept = self.deweighted_resampling(Y, self.n_kde, scheme=self.resampling_scheme)
         
         self.Xobs = X[idx_accept]
         self.weights = self.cleansing_weights(Y[idx_accept])
@@ -77,6 +101,9 @@ class WeightedKernelDensityEstimation(
         self._compute_covariance()
         if self.compute_cdf:
             self._compute_constant()
+        self._compute_whitening()
+        if self.pdf_method == "tree":
+            self._compute_tree()
         
     def _compute_constant(self):
         p_lb = Phi(self.bounds[0], loc=self.Xobs, covariance_matrix=self.covariance)
@@ -106,9 +133,192 @@ class WeightedKernelDensityEstimation(
         self._data_covariance /= 1 - self.weights.pow(2).sum()
         self.covariance = self.make_cov_psd(self._data_covariance * self.bw.pow(2))
 
+    def _compute_whitening(self):
+        """
+        Cache the Cholesky factor of the shared covariance, the whitened centres of the Gaussians,
+        and the log normalising constant, so that the PDF needs no factorisation per call.
+        """
+        eye = torch.eye(self.n_dims, dtype=self.covariance.dtype, device=self.covariance.device)
+        jitter = 0
+        L, info = torch.linalg.cholesky_ex(self.covariance)
+        while info > 0:
+            jitter = max(2 * jitter, 1e-8 * self.covariance.diagonal().mean().item())
+            L, info = torch.linalg.cholesky_ex(self.covariance + jitter * eye)
+        self.cov_root = L
+        self.Zobs = torch.linalg.solve_triangular(L, self.Xobs.T, upper=False).T
+        self.Zobs_sq = self.Zobs.pow(2).sum(-1)
+        self.log_norm = - 0.5 * self.n_dims * math.log(2 * math.pi) - L.diagonal().log().sum()
+        if self.compute_cdf and self.bounds is not None:
+            self.log_weights = (self.weights / self.constant).log()
+        else:
+            self.log_weights = self.weights.log()
+    
+    def logpdf_whitened(self, X):
+        """
+        Compute the log PDF at X with the cached whitening, ignoring the bounds.
+        The squared Mahalanobis distances are computed blockwise as |a|^2 + |b|^2 - 2 a @ b.T
+        in the whitened space, and reduced with logsumexp, so the memory is O(block_size * n_kde).
+        
+        Args:
+        - X: torch.tensor, the observed data X
+        
+        Return:
+        - Ypreds: torch.tensor, the log PDF at X
+        """
+        block_size = self.block_size
+        if block_size is None:
+            block_size = max(1, 2**22 // self.n_kde)
+        
+        Ypreds = []
+        for X_block in torch.split(X, block_size):
+            Z = torch.linalg.solve_triangular(self.cov_root, X_block.T, upper=False).T
+            Ypreds.append(self._logpdf_whitened_block(Z))
+        return torch.cat(Ypreds)
+    
+    def _logpdf_whitened_block(self, Z):
+        """
+        Compute the exact log PDF at the whitened points Z over all the Gaussians.
+        
+        Args:
+        - Z: torch.tensor, the whitened inputs
+        
+        Return:
+        - Ypreds: torch.tensor, the log PDF at Z
+        """
+        D2 = (Z.pow(2).sum(-1).unsqueeze(1) + self.Zobs_sq.unsqueeze(0) - 2 * Z @ self.Zobs.T).clamp(min=0)
+        return torch.logsumexp(self.log_weights.unsqueeze(0) - 0.5 * D2, dim=1) + self.log_norm
+    
+    def _compute_tree(self):
+        """
+        Build a single-level ball tree over the whitened centres of the Gaussians.
+        The centres are clustered by k-means, and each cluster stores its centre, radius, and total weight.
+        The centres are sorted by cluster, so that the members of each cluster are contiguous.
+        """
+        n_clusters = self.n_clusters
+        if n_clusters is None:
+            n_clusters = max(1, int(math.sqrt(self.n_kde)))
+        n_clusters = min(n_clusters, self.n_kde)
+        labels, centres = MiniBatchKMeans(self.Zobs, n_clusters)
+        
+        order = labels.argsort()
+        labels = labels[order]
+        counts = torch.bincount(labels, minlength=n_clusters)
+        nonempty = counts > 0
+        self.tree_counts = counts[nonempty]
+        self.tree_starts = self.tree_counts.cumsum(0) - self.tree_counts
+        self.tree_centres = centres[nonempty]
+        self.tree_Zobs = self.Zobs[order]
+        self.tree_log_weights = self.log_weights[order]
+        
+        labels = torch.cumsum(nonempty, 0)[labels] - 1  # relabel without the empty clusters
+        distances = (self.tree_Zobs - self.tree_centres[labels]).norm(dim=1)
+        n_tree = len(self.tree_centres)
+        self.tree_radii = torch.zeros(n_tree, dtype=distances.dtype, device=distances.device).scatter_reduce(
+            0, labels, distances, reduce="amax",
+        )
+        self.tree_log_weights_sum = torch.full(
+            (n_tree,), -float("inf"), dtype=distances.dtype, device=distances.device,
+        ).scatter_reduce(0, labels, self.tree_log_weights, reduce="amax")
+        # log of the total weight per cluster, with the per-cluster maximum factored out for stability
+        shifted = (self.tree_log_weights - self.tree_log_weights_sum[labels]).exp().nan_to_num(0.)
+        self.tree_log_weights_sum = self.tree_log_weights_sum + torch.zeros_like(
+            self.tree_log_weights_sum,
+        ).index_add_(0, labels, shifted).log()
+    
+    def logpdf_tree(self, X):
+        """
+        Compute the approximate log PDF at X with the ball tree, ignoring the bounds.
+        For each cluster c with centre m_c, radius r_c, and total weight W_c, the sum of the Gaussians
+        at a whitened point z is bounded by W_c exp(-(|z - m_c| + r_c)^2 / 2) and W_c exp(-max(0, |z - m_c| - r_c)^2 / 2).
+        The clusters with the smallest gaps between the bounds are approximated by the midpoint of the bounds
+        as long as the sum of their half gaps is within rtol times the lower bound of the total,
+        and the rest is evaluated exactly, so the relative error of the PDF is at most rtol.
+        Gathering the members of the remaining clusters is slower than the dense evaluation of the
+        "whitened" engine per pair, so a block falls back to the "whitened" engine if more than
+        max_exact_ratio of its pairs with the Gaussians would be evaluated exactly, e.g. when the
+        centres are not clustered. The number of blocks and fallbacks is stored in self.tree_info.
+        
+        Args:
+        - X: torch.tensor, the observed data X
+        
+        Return:
+        - Ypreds: torch.tensor, the log PDF at X
+        """
+        block_size = self.block_size
+        if block_size is None:
+            block_size = max(1, 2**22 // self.n_kde)
+        
+        self.tree_info = {"n_blocks": 0, "n_fallbacks": 0}
+        Ypreds = []
+        for X_block in torch.split(X, block_size):
+            self.tree_info["n_blocks"] += 1
+            Z = torch.linalg.solve_triangular(self.cov_root, X_block.T, upper=False).T
+            d = torch.cdist(Z, self.tree_centres)
+            log_ub = self.tree_log_weights_sum - 0.5 * (d - self.tree_radii).clamp(min=0).pow(2)
+            log_lb = self.tree_log_weights_sum - 0.5 * (d + self.tree_radii).pow(2)
+            shift = log_ub.max(dim=1, keepdim=True).values
+            ub = (log_ub - shift).exp()
+            lb = (log_lb - shift).exp()
+            
+            # approximate the clusters with the smallest gaps within the error budget
+            half_gap = 0.5 * (ub - lb)
+            half_gap_sorted, order = half_gap.sort(dim=1)
+            budget = self.rtol * lb.sum(dim=1, keepdim=True)
+            approximated_sorted = half_gap_sorted.cumsum(dim=1) <= budget
+            approximated = torch.zeros_like(approximated_sorted).scatter(1, order, approximated_sorted)
+            Y = (0.5 * (ub + lb) * approximated).sum(dim=1)
+            
+            # exact evaluation over the members of the remaining clusters
+            rows, clusters = torch.where(approximated.logical_not())
+            counts = self.tree_counts[clusters]
+            if counts.sum() > self.max_exact_ratio * len(Z) * self.n_kde:
+                self.tree_info["n_fallbacks"] += 1
+                Ypreds.append(self._logpdf_whitened_block(Z))
+                continue
+            rows = rows.repeat_interleave(counts)
+            offsets = torch.arange(len(rows), device=rows.device) - (counts.cumsum(0) - counts).repeat_interleave(counts)
+            members = self.tree_starts[clusters].repeat_interleave(counts) + offsets
+            D2 = (Z[rows] - self.tree_Zobs[members]).pow(2).sum(-1)
+            Y = Y.index_add(0, rows, (self.tree_log_weights[members] - 0.5 * D2 - shift[rows, 0]).exp())
+            Ypreds.append(Y.log() + shift[:, 0] + self.log_norm)
+        return torch.cat(Ypreds)
+    
+    def out_of_bounds(self, X):
+        """
+        Args:
+        - X: torch.tensor, the observed data X
+        
+        Return:
+        - indices: torch.tensor, bool, true if X is out of the bounds
+        """
+        indices_min = (X < self.bounds[0]).any(axis=1)
+        indices_max = (X > self.bounds[1]).any(axis=1)
+        return torch.logical_or(indices_min, indices_max)
+    
     def pdf(self, X):
         """
         Compute the probability density function (PDF) at X
+        The "whitened" engine shares the cached Cholesky factor over all the Gaussians, see logpdf_whitened.
+        The "tree" engine approximates the PDF within the relative error rtol, see logpdf_tree.
+        The "mvn" engine evaluates MultivariateNormal over all the pairs of X and the Gaussians.
+        
+        Args:
+        - X: torch.tensor, the observed data X
+        
+        
+        Return:
+        - Ypreds: torch.tensor, the PDF at X
+        """
+        if self.pdf_method in ["whitened", "tree"]:
+            return self.logpdf(X).exp()
+        elif self.pdf_method == "mvn":
+            return self.pdf_mvn(X)
+        else:
+            raise ValueError('pdf_method should be from ["whitened", "tree", "mvn"]')
+    
+    def pdf_mvn(self, X):
+        """
+        Compute the probability density function (PDF) at X via MultivariateNormal
         
         Args:
         - X: torch.tensor, the observed data X
@@ -154,7 +364,17 @@ class WeightedKernelDensityEstimation(
         Return:
         - Ypreds: torch.tensor, the log PDF at X
         """
-        return self.pdf(X).log()
+        if self.pdf_method == "whitened":
+            Ypreds = self.logpdf_whitened(X)
+        elif self.pdf_method == "tree":
+            Ypreds = self.logpdf_tree(X)
+        else:
+            return self.pdf(X).log()
+        
+        if not self.bounds == None:
+            # Thresholding out-of-bound samples
+            Ypreds[self.out_of_bounds(X)] = -float("inf")
+        return Ypreds
     
     def rejection_sampling(self, mean, cov, cnt, n_repeat=10):
         """
@@ -221,6 +441,86 @@ class WeightedKernelDensityEstimation(
     def sample(self, N_rec):
         """
         Sampling from KDE
+        The "vectorised" sampler draws all the samples at once, see sample_vectorised.
+        The "loop" sampler draws the samples Gaussian by Gaussian.
+        
+        Args:
+        - N_rec: int, the number of samples
+        
+        Return
+        - samples: torh.tensor, samples from KDE
+        """
+        if self.sample_method == "vectorised":
+            return self.sample_vectorised(N_rec)
+        elif self.sample_method == "loop":
+            return self.sample_loop(N_rec)
+        else:
+            raise ValueError('sample_method should be from ["vectorised", "loop"]')
+    
+    def sample_vectorised(self, N_rec, budget=100):
+        """
+        Vectorised sampling from KDE
+        The Gaussians are drawn in one multinomial call, and the noise of all the samples is drawn
+        in one matmul with the cached Cholesky factor. With the bounds, only the outstanding rows are redrawn
+        from their own Gaussians until every row is accepted, so each Gaussian is truncated to the bounds
+        as in rejection_sampling and keeps its share of the samples. The number of draws per outstanding row
+        is doubled every round, up to budget * N_rec draws in total. The rows still outstanding after the budget
+        are topped up Gaussian by Gaussian with sample_from_Gaussian.
+        
+        Args:
+        - N_rec: int, the number of samples
+        - budget: int, the maximum number of draws of the vectorised rounds per sample
+        
+        Return
+        - samples: torh.tensor, samples from KDE
+        """
+        if (self.covariance == 0).all():
+            warnings.warn("invalid Gaussian in the kernel density estimation")
+            return self.null()
+        
+        idx = torch.multinomial(self.weights, N_rec, replacement=True)
+        noise = self.standardise_tensor(torch.randn(N_rec, self.n_dims))
+        samples = self.Xobs[idx] + noise @ self.cov_root.T
+        if self.bounds == None:
+            return samples
+        
+        rejected = self.out_of_bounds(samples)
+        n_draws = N_rec
+        n_per_row = 1
+        while rejected.any():
+            idx_rejected = torch.where(rejected)[0]
+            n_per_row = min(2 * n_per_row, (budget * N_rec - n_draws) // len(idx_rejected))
+            if n_per_row < 1:
+                break
+            noise = self.standardise_tensor(torch.randn(len(idx_rejected), n_per_row, self.n_dims))
+            proposals = self.Xobs[idx[idx_rejected]].unsqueeze(1) + noise @ self.cov_root.T
+            accepted = self.out_of_bounds(proposals.view(-1, self.n_dims)).logical_not().view(len(idx_rejected), n_per_row)
+            n_draws += accepted.numel()
+            
+            # the first accepted draw of each outstanding row
+            filled = accepted.any(dim=1)
+            first = accepted.to(torch.uint8).argmax(dim=1)
+            samples[idx_rejected[filled]] = proposals[filled, first[filled]]
+            rejected[idx_rejected[filled]] = False
+        
+        if rejected.any():
+            # top up the rest Gaussian by Gaussian to keep the share of each Gaussian
+            idx_rejected = torch.where(rejected)[0]
+            components, counts = idx[idx_rejected].unique(return_counts=True)
+            for component, cnt in zip(components, counts):
+                rows = idx_rejected[idx[idx_rejected] == component]
+                topup = self.sample_from_Gaussian(self.Xobs[component], self.covariance, int(cnt))
+                samples[rows[:len(topup)]] = topup
+                rejected[rows[:len(topup)]] = False
+            if rejected.any():
+                warnings.warn(
+                    f"{int(rejected.sum())} samples of the kernel density estimation could not be drawn within the bounds"
+                )
+        return samples[rejected.logical_not()]
+    
+    def sample_loop(self, N_rec):
+        """
+        Sampling from KDE Gaussian by Gaussian
         
         Args:
         - N_rec: int, the number of samples
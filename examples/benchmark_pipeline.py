@@ -0,0 +1,67 @@
+import time
+import torch
+import warnings
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from experiments._hartmann import setup_hartmann
+from experiments._ackley import setup_ackley
+from SOBER._sober import Sober
+from benchmark_recombination import fit_model
+warnings.filterwarnings('ignore')
+
+
+def benchmark(sober, n_rec, n_nys, pipelined, n_workers):
+    """
+    Measure the wall-clock time of sampling the candidates, and the overlap of the pipeline.
+    The overlap is the ratio of the time spent on sampling from the prior and on scoring with pi
+    to the wall-clock time of the last pipelined draw, i.e. 1 without any overlap.
+
+    Args:
+    - sober: class, the class of Sober
+    - n_rec: int, the number of samples for recombination
+    - n_nys: int, the number of samples for Nyström approximation
+    - pipelined: bool, sample the candidates through the pipeline if true, otherwise not.
+    - n_workers: int, the number of worker threads of the pipeline
+
+    Return:
+    - interval: float, the wall-clock time [s]
+    - overlap: float, the overlap of the last pipelined draw, 1 without the pipeline
+    """
+    sober.initialise_prior()
+    start = time.monotonic()
+    sober.sampling_candidates(n_rec, n_nys, pipelined=pipelined, n_workers=n_workers)
+    interval = time.monotonic() - start
+    overlap = sober.pipeline_info["overlap"] if pipelined else 1.
+    return interval, overlap
+
+
+if __name__ == "__main__":
+    seed = 0
+    torch.manual_seed(seed)  # random seed
+
+    problems = {
+        "hartmann": setup_hartmann,
+        "ackley": setup_ackley,
+    }
+    n_rec = 200000     # number of candidates sampled from pi
+    n_nys = 500        # number of samples for Nyström approximation
+    n_init = 100       # number of initial samples
+    n_repeats = 5      # number of repeats per setting
+
+    for name, setup in problems.items():
+        prior, TrueFunction = setup()
+        Xall = prior.sample(n_init)
+        Yall = TrueFunction(Xall)
+        model = fit_model(Xall, Yall)
+        sober = Sober(prior, model)
+
+        for pipelined, n_workers in [(False, 1), (True, 1), (True, 2)]:
+            results = torch.tensor([
+                benchmark(sober, n_rec, n_nys, pipelined, n_workers)
+                for _ in range(n_repeats)
+            ])
+            interval, overlap = results.mean(0)
+            setting = f"pipelined, {n_workers} workers" if pipelined else "sequential"
+            print(f"{name} ({setting}) mean time [s]: {interval:.5e}, mean overlap: {overlap:.2f}")
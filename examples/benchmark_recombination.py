@@ -0,0 +1,127 @@
+import time
+import torch
+import warnings
+from gpytorch.kernels import ScaleKernel, RBFKernel
+from gpytorch.likelihoods import GaussianLikelihood
+from gpytorch.mlls import ExactMarginalLogLikelihood
+from gpytorch.constraints import Interval
+from botorch.models import SingleTaskGP
+from botorch.fit import fit_gpytorch_model
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from experiments._hartmann import setup_hartmann
+from experiments._ackley import setup_ackley
+from experiments._rosenbrock import setup_rosenbrock
+from experiments._shekel import setup_shekel
+from SOBER._sober import Sober
+from SOBER._gp import predict_mean
+from SOBER._utils import TensorManager
+warnings.filterwarnings('ignore')
+tm = TensorManager()
+
+def set_rbf_model(X, Y):
+    """
+    Set up the Gaussian process model with RBF kernel.
+
+    Args:
+    - X: torch.tensor, the observed input X
+    - Y: torch.tensor, the observed outcome Y
+
+    Return:
+    - model: gpytorch.models, function of GP model.
+    """
+    base_kernel = RBFKernel()
+    covar_module = ScaleKernel(base_kernel)
+
+    # Fit a GP model
+    train_Y = (Y - Y.mean()) / Y.std()
+    train_Y = train_Y.view(-1).unsqueeze(1)
+    likelihood = GaussianLikelihood(noise_constraint=Interval(1e-8, 1e-3))
+    model = SingleTaskGP(X, train_Y, likelihood=likelihood, covar_module=covar_module)
+    if tm.is_cuda():
+        return model.cuda()
+    else:
+        return model
+
+def fit_model(X, Y):
+    """
+    Optimise the hyperparameters of Gaussian process model using L-BFGS-B (BoTorch optimizer)
+
+    Args:
+    - X: torch.tensor, the observed input X
+    - Y: torch.tensor, the observed outcome Y
+
+    Return:
+    - model: gpytorch.models, the optimised GP model.
+    """
+    model = set_rbf_model(X, Y)
+    mll = ExactMarginalLogLikelihood(model.likelihood, model)
+    fit_gpytorch_model(mll)
+    return model
+
+def benchmark(sober, X_cand, X_nys, weights, batch_size, car_engine):
+    """
+    Measure the wall-clock time and the quadrature error of kernel recombination.
+    The error is the absolute difference between the quadrature of the GP posterior mean
+    over the recombined batch and over all the candidates.
+
+    Args:
+    - sober: class, the class of Sober
+    - X_cand: torch.tensor, samples for recombination
+    - X_nys: torch.tensor, samples for Nyström approximation
+    - weights: torch.tensor, weights
+    - batch_size: int, the number of batch samples
+    - car_engine: string, the reduction engine, "standard" or "vectorised"
+
+    Return:
+    - interval: float, the wall-clock time [s]
+    - error: float, the quadrature error of the posterior mean
+    """
+    start = time.monotonic()
+    idx_rchq, w_rchq = sober.sampling_recombination(
+        X_cand,
+        X_nys,
+        weights.clone(),
+        batch_size,
+        car_engine=car_engine,
+    )
+    interval = time.monotonic() - start
+
+    model = sober.pi.model
+    error = (w_rchq @ predict_mean(X_cand[idx_rchq], model) - weights @ predict_mean(X_cand, model)).abs()
+    return interval, error.item()
+
+
+if __name__ == "__main__":
+    seed = 0
+    torch.manual_seed(seed)  # random seed
+
+    problems = {
+        "hartmann": setup_hartmann,
+        "ackley": setup_ackley,
+        "rosenbrock": setup_rosenbrock,
+        "shekel": setup_shekel,
+    }
+    batch_size = 100   # number of batch samples
+    n_rec = 20000      # number of candidates sampled from pi
+    n_nys = 500        # number of samples for Nyström approximation
+    n_init = 100       # number of initial samples
+    n_repeats = 10     # number of repeats per reduction engine
+
+    for name, setup in problems.items():
+        prior, TrueFunction = setup()
+        Xall = prior.sample(n_init)
+        Yall = TrueFunction(Xall)
+        model = fit_model(Xall, Yall)
+        sober = Sober(prior, model)
+        X_cand, X_nys, weights = sober.sampling_candidates(n_rec, n_nys)
+
+        for car_engine in ["standard", "vectorised"]:
+            results = torch.tensor([
+                benchmark(sober, X_cand, X_nys, weights, batch_size, car_engine)
+                for _ in range(n_repeats)
+            ])
+            interval, error = results.mean(0)
+            print(f"{name} ({car_engine}) mean time [s]: {interval:.5e}, mean quadrature error: {error:.5e}")
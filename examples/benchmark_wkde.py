@@ -0,0 +1,80 @@
+import time
+import torch
+import warnings
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from SOBER._wkde import WeightedKernelDensityEstimation
+from SOBER._utils import TensorManager
+warnings.filterwarnings('ignore')
+tm = TensorManager()
+
+def set_wkde(n_kde, n_dims, pdf_method, rtol, clustered=True):
+    """
+    Set up the weighted kernel density estimation over a mixture of well-separated clusters,
+    mimicking the prior updated on a multimodal pi, or over uniformly spread centres,
+    mimicking the prior of the early iterations.
+
+    Args:
+    - n_kde: int, the number of Gaussians for KDE
+    - n_dims: int, the number of dimensions
+    - pdf_method: string, the PDF engine, "whitened" or "tree"
+    - rtol: float, the relative error tolerance of the "tree" engine
+    - clustered: bool, draw the centres around 10 clusters if true, otherwise uniformly.
+
+    Return:
+    - wkde: class, WeightedKernelDensityEstimation
+    """
+    if clustered:
+        centres = tm.rand(n_dims, 10)
+        X = centres[torch.randint(10, (n_kde,))] + 0.02 * tm.standardise_tensor(torch.randn(n_kde, n_dims))
+    else:
+        X = tm.rand(n_dims, n_kde)
+    weights = tm.rand(1, n_kde, qmc=False).view(-1)
+    wkde = WeightedKernelDensityEstimation(X, weights, n_dims, n_kde=n_kde, pdf_method=pdf_method, rtol=rtol)
+    return wkde
+
+def benchmark(wkde, X):
+    """
+    Measure the wall-clock time of the log PDF
+
+    Args:
+    - wkde: class, WeightedKernelDensityEstimation
+    - X: torch.tensor, the inputs
+
+    Return:
+    - interval: float, the wall-clock time [s]
+    - logpdf: torch.tensor, the log PDF at X
+    """
+    start = time.monotonic()
+    logpdf = wkde.logpdf(X)
+    interval = time.monotonic() - start
+    return interval, logpdf
+
+
+if __name__ == "__main__":
+    seed = 0
+    torch.manual_seed(seed)  # random seed
+
+    n_dims = 5         # number of dimensions
+    n_rec = 100000     # number of inputs to evaluate
+    for clustered in [True, False]:
+        case = "clustered" if clustered else "unclustered"
+        for n_kde in [1024, 4096, 16384]:
+            wkde = set_wkde(n_kde, n_dims, "whitened", 1e-2, clustered=clustered)
+            X = wkde.sample(n_rec)
+            interval_exact, logpdf_exact = benchmark(wkde, X)
+            print(f"{case} n_kde: {n_kde} (whitened) time [s]: {interval_exact:.5e}")
+
+            for rtol in [1e-1, 1e-2, 1e-3]:
+                wkde.pdf_method = "tree"
+                wkde.rtol = rtol
+                wkde._compute_tree()
+                interval, logpdf = benchmark(wkde, X)
+                error = (logpdf - logpdf_exact).exp().sub(1).abs().max()
+                fallback_rate = wkde.tree_info["n_fallbacks"] / wkde.tree_info["n_blocks"]
+                print(
+                    f"{case} n_kde: {n_kde} (tree, rtol={rtol:.0e}) time [s]: {interval:.5e}, "
+                    f"max relative error: {error:.5e}, fallback rate: {fallback_rate:.2f}"
+                )